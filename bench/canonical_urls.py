@@ -0,0 +1,95 @@
+"""Corpus de URLs: comprueba normalize_music_url y mide la fragmentación de claves.
+
+Cada bloque de bench/url_variants.txt es una misma obra. Para cada uno se
+cuentan las claves distintas con la normalización anterior (solo intl-xx de
+Spotify) y con la canónica. Sale con código 1 si algún bloque no colapsa a
+una sola clave, si dos bloques comparten clave o si una URL "= ..." cambia.
+
+    python bench/canonical_urls.py [corpus.txt]
+"""
+import os
+import re
+import sys
+from urllib.parse import urlparse, urlunparse
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "url_variants.txt")
+
+
+# ---- Normalización anterior, para comparar ----
+def legacy_normalize(url: str) -> str:
+    p = urlparse(url)
+    if "spotify.com" in p.netloc.lower():
+        path = re.sub(r"^/intl-[a-z]{2}(?=/)", "", p.path, flags=re.I)
+        path = re.sub(r"^/intl-[a-z]{2}-[a-z]{2}(?=/)", "", path, flags=re.I)
+        return urlunparse((p.scheme or "https", p.netloc, path, "", "", ""))
+    return urlunparse((p.scheme or "https", p.netloc, p.path, p.params, p.query, ""))
+
+
+def load_corpus(path: str) -> tuple[list[list[str]], list[str]]:
+    groups, current, fixed = [], [], []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line.startswith("#"):
+                continue
+            if line.startswith("= "):
+                fixed.append(line[2:].strip())
+                continue
+            if not line:
+                if current:
+                    groups.append(current)
+                current = []
+                continue
+            current.append(line)
+    if current:
+        groups.append(current)
+    return groups, fixed
+
+
+def main():
+    groups, fixed = load_corpus(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CORPUS)
+    urls = sum(len(g) for g in groups)
+    old_keys = new_keys = 0
+    failed = 0
+    owner: dict[str, str] = {}
+    for group in groups:
+        old = {legacy_normalize(u) for u in group}
+        new = {bot.normalize_music_url(u) for u in group}
+        old_keys += len(old)
+        new_keys += len(new)
+        if len(new) != 1:
+            failed += 1
+            print(f"FALLA ({len(new)} claves): " + " | ".join(sorted(new)))
+            continue
+        key = next(iter(new))
+        if key in owner:
+            failed += 1
+            print(f"FALLA (obras distintas, misma clave): {group[0]} | {owner[key]} -> {key}")
+            continue
+        owner[key] = group[0]
+        print(f"ok {len(group):>2} variantes {len(old):>2} -> 1  {key}")
+
+    for url in fixed:
+        out = bot.normalize_music_url(url)
+        if out != url:
+            failed += 1
+            print(f"FALLA (cambió): {url} -> {out}")
+        else:
+            print(f"ok sin cambios  {url}")
+
+    print(
+        f"\n{len(groups)} obras, {urls} URLs: claves de cache {old_keys} -> {new_keys} "
+        f"(ideal {len(groups)}); fragmentación eliminada "
+        f"{(old_keys - new_keys) / max(1, old_keys - len(groups)):.0%}; "
+        f"{len(fixed)} URLs que no deben cambiar"
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Descarga las páginas reales que usa bench/head_extract.py.
+
+Guarda en bench/pages/ una canción de Spotify y un álbum de Apple Music tal
+como los recibe el bot (mismo cliente, cabeceras e idioma). Las páginas se
+versionan junto al benchmark para que la comparación sea reproducible:
+
+    python bench/fetch_pages.py && git add bench/pages/*.html
+"""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), "pages")
+PAGES = {
+    "spotify-track.html": "https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT",
+    "apple-album.html": "https://music.apple.com/cl/album/whenever-you-need-somebody/1558533900",
+}
+
+
+async def main():
+    os.makedirs(PAGES_DIR, exist_ok=True)
+    client = bot.get_http_client()
+    try:
+        for name, url in PAGES.items():
+            r = await client.get(url, timeout=bot.http_timeout(20))
+            r.raise_for_status()
+            path = os.path.join(PAGES_DIR, name)
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(r.text)
+            print(f"{name}: {len(r.text) // 1024} KB <- {url}")
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
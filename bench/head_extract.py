@@ -0,0 +1,92 @@
+"""Micro-benchmark: parse_html_head vs. los extractores regex anteriores.
+
+Sin argumentos mide las páginas reales de bench/pages/ (descargadas con
+bench/fetch_pages.py); también acepta otras páginas guardadas:
+
+    python bench/head_extract.py [pagina.html ...] [-n 200]
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import timeit
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+
+TAGS = bot.PAGE_META_TAGS
+
+
+# ---- Implementación anterior (una pasada por regex y por tag) ----
+def legacy_title_tag(html_text: str) -> str | None:
+    m = re.search(r"<title>(.*?)</title>", html_text or "", re.I | re.S)
+    return bot._norm_text(m.group(1)) if m else None
+
+
+def legacy_meta_content(html_text: str, prop: str) -> str | None:
+    patterns = [
+        rf'<meta[^>]+property=["\']{re.escape(prop)}["\'][^>]+content=["\']([^"\']+)["\']',
+        rf'<meta[^>]+content=["\']([^"\']+)["\'][^>]+property=["\']{re.escape(prop)}["\']',
+        rf'<meta[^>]+name=["\']{re.escape(prop)}["\'][^>]+content=["\']([^"\']+)["\']',
+    ]
+    for p in patterns:
+        m = re.search(p, html_text or "", re.I)
+        if m:
+            return bot._norm_text(m.group(1))
+    return None
+
+
+def legacy_jsonld(html_text: str) -> list[dict]:
+    out = []
+    for m in re.finditer(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', html_text or "", re.I | re.S):
+        out.extend(bot._parse_jsonld_blob(m.group(1)))
+    return out
+
+
+def legacy(html_text: str) -> dict:
+    meta = {"title": legacy_title_tag(html_text)}
+    for tag in TAGS:
+        meta[tag] = legacy_meta_content(html_text, tag)
+    meta["jsonld"] = legacy_jsonld(html_text)
+    return meta
+
+
+def single_pass(html_text: str) -> dict:
+    head = bot.parse_html_head(html_text)
+    meta = {"title": bot._norm_text(head["title"]) if head["title"] else None}
+    for tag in TAGS:
+        content = head["meta"].get(tag)
+        meta[tag] = bot._norm_text(content) if content else None
+    meta["jsonld"] = head["jsonld"]
+    return meta
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pages", nargs="*")
+    ap.add_argument("-n", type=int, default=200)
+    args = ap.parse_args()
+
+    pages = args.pages or sorted(glob.glob(os.path.join(os.path.dirname(__file__), "pages", "*.html")))
+    if not pages:
+        sys.exit("No hay páginas en bench/pages/: ejecuta antes python bench/fetch_pages.py")
+    for path in pages:
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            html_text = fh.read()
+        old, new = legacy(html_text), single_pass(html_text)
+        same = json.dumps(old, sort_keys=True) == json.dumps(new, sort_keys=True)
+        t_old = timeit.timeit(lambda: legacy(html_text), number=args.n) / args.n * 1e6
+        t_new = timeit.timeit(lambda: single_pass(html_text), number=args.n) / args.n * 1e6
+        print(
+            f"{os.path.basename(path)}: {len(html_text) // 1024} KB | "
+            f"regex {t_old:,.0f} µs | una pasada {t_new:,.0f} µs | "
+            f"x{t_old / t_new:.1f} | mismo resultado: {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
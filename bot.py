@@ -5,9 +5,19 @@ import json
 import html
 import logging
 import asyncio
+import contextlib
+import contextvars
+import functools
+import importlib.util
 import unicodedata
+import sys
 import time
-from collections import deque
+import random
+import signal
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
 from urllib.parse import (
     urlparse, urlunparse, parse_qs, quote, unquote, quote_plus
 )
@@ -42,13 +52,60 @@ SETLIST_PAGE_SIZE = int(os.environ.get("SETLIST_PAGE_SIZE", "10"))
 SETLIST_MAX_CONCURRENCY = int(os.environ.get("SETLIST_MAX_CONCURRENCY", "5"))
 
 # Rate limit / cache settings
-ODESLI_MAX_CONCURRENCY = int(os.environ.get("ODESLI_MAX_CONCURRENCY", "1"))
+ODESLI_MAX_CONCURRENCY = int(os.environ.get("ODESLI_MAX_CONCURRENCY", "4"))
 ODESLI_MAX_RETRIES = int(os.environ.get("ODESLI_MAX_RETRIES", "2"))
+# Cuota pública de api.song.link sin API key: 10 peticiones por minuto.
+ODESLI_RATE_PER_MIN = float(os.environ.get("ODESLI_RATE_PER_MIN", "10"))
+ODESLI_BURST = float(os.environ.get("ODESLI_BURST", "3"))
+ODESLI_MAX_QUEUE_WAIT = float(os.environ.get("ODESLI_MAX_QUEUE_WAIT", "4"))
 ODESLI_CACHE_TTL = int(os.environ.get("ODESLI_CACHE_TTL", "21600"))
+# Políticas por host (HOST_POLICIES): {PREFIJO}_RATE_PER_MIN, _BURST, _MAX_CONCURRENCY,
+# _MAX_RETRIES, _BREAKER_THRESHOLD y _BREAKER_COOLDOWN sobreescriben cada host.
+UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", "5"))
+UPSTREAM_BREAKER_COOLDOWN = float(os.environ.get("UPSTREAM_BREAKER_COOLDOWN", "30"))
+UPSTREAM_MAX_QUEUE_WAIT = float(os.environ.get("UPSTREAM_MAX_QUEUE_WAIT", "2"))
+# Hedging ({PREFIJO}_HEDGE=1): segunda petición idéntica si la primera supera el p95 del host.
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", "0.05"))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.15"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
 GENERIC_CACHE_TTL = int(os.environ.get("GENERIC_CACHE_TTL", "21600"))
 LYRICS_CACHE_TTL = int(os.environ.get("LYRICS_CACHE_TTL", "43200"))
 SETLIST_CACHE_TTL = int(os.environ.get("SETLIST_CACHE_TTL", "86400"))
 SPOTIFY_CACHE_TTL = int(os.environ.get("SPOTIFY_CACHE_TTL", "21600"))
+SONG_INDEX_TTL = int(os.environ.get("SONG_INDEX_TTL", str(30 * 86400)))
+ENTITY_CACHE_TTL = int(os.environ.get("ENTITY_CACHE_TTL", str(7 * 86400)))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+GENERIC_CACHE_MAX_BYTES = int(os.environ.get("GENERIC_CACHE_MAX_BYTES", str(24 * 1024 * 1024)))
+CACHE_MAX_ITEMS = int(os.environ.get("CACHE_MAX_ITEMS", "5000"))
+CACHE_SWEEP_INTERVAL = int(os.environ.get("CACHE_SWEEP_INTERVAL", "120"))
+SPOTIFY_RESOLVE_DEADLINE = float(os.environ.get("SPOTIFY_RESOLVE_DEADLINE", "8"))
+FALLBACK_DEADLINE = float(os.environ.get("FALLBACK_DEADLINE", "8"))
+FALLBACK_PLATFORM_TIMEOUT = float(os.environ.get("FALLBACK_PLATFORM_TIMEOUT", "6"))
+INLINE_BUDGET = float(os.environ.get("INLINE_BUDGET", "8"))
+MESSAGE_BUDGET = float(os.environ.get("MESSAGE_BUDGET", "25"))
+SETLIST_BUDGET = float(os.environ.get("SETLIST_BUDGET", "45"))
+UPSTREAM_MIN_TIMEOUT = float(os.environ.get("UPSTREAM_MIN_TIMEOUT", "1"))
+OPTIONAL_MIN_BUDGET = float(os.environ.get("OPTIONAL_MIN_BUDGET", "3"))
+INLINE_DEBOUNCE = float(os.environ.get("INLINE_DEBOUNCE", "0.6"))
+INLINE_RESULT_TTL = int(os.environ.get("INLINE_RESULT_TTL", "1800"))
+INLINE_SHARED_CACHE_TIME = int(os.environ.get("INLINE_SHARED_CACHE_TIME", "300"))
+PROGRESSIVE_REPLIES = os.environ.get("PROGRESSIVE_REPLIES", "1").strip().lower() not in ("0", "false", "no")
+PROGRESSIVE_COALESCE_WINDOW = float(os.environ.get("PROGRESSIVE_COALESCE_WINDOW", "1.5"))
+SETLIST_PROGRESS_INTERVAL = float(os.environ.get("SETLIST_PROGRESS_INTERVAL", "1"))
+STREAM_MAX_BYTES = int(os.environ.get("STREAM_MAX_BYTES", str(768 * 1024)))
+YT_STREAM_MAX_BYTES = int(os.environ.get("YT_STREAM_MAX_BYTES", str(1536 * 1024)))
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", "").strip()
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+HTTP_POOL_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", "5"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+# Conexiones extra para hosts sin política (páginas de Apple Music, YouTube, setlist.fm web)
+HTTP_EXTRA_CONNECTIONS = int(os.environ.get("HTTP_EXTRA_CONNECTIONS", "10"))
+# HTTP/2 necesita el extra opcional: pip install "httpx[http2]"
+HTTP2 = os.environ.get("HTTP2", "0").strip().lower() not in ("0", "false", "no")
+HTTP_WARMUP = os.environ.get("HTTP_WARMUP", "1").strip().lower() not in ("0", "false", "no")
+HTTP_WARMUP_INTERVAL = float(os.environ.get("HTTP_WARMUP_INTERVAL", "0"))
+CACHE_DB_FLUSH_INTERVAL = float(os.environ.get("CACHE_DB_FLUSH_INTERVAL", "5"))
 
 URL_RE = re.compile(r"https?://\S+")
 MUSIC_DOMAINS = (
@@ -64,45 +121,889 @@ SETLIST_DOMAIN = "setlist.fm"
 
 # ====== HTTP CLIENT ======
 HTTP_CLIENT: httpx.AsyncClient | None = None
-ODESLI_SEM = asyncio.Semaphore(ODESLI_MAX_CONCURRENCY)
 
 
 def now_ts() -> float:
     return time.time()
 
 
-def ttl_get(cache: dict, key: str):
-    item = cache.get(key)
-    if not item:
+# ---- Presupuesto de latencia por update ----
+# Cada entry point fija un plazo absoluto; toda llamada upstream recorta su
+# propio timeout a lo que queda y las búsquedas opcionales se saltan si no alcanza.
+UPDATE_DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar("update_deadline", default=None)
+
+
+def with_budget(seconds: float):
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = UPDATE_DEADLINE.set(time.monotonic() + seconds)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                UPDATE_DEADLINE.reset(token)
+        return wrapper
+    return deco
+
+
+def time_left() -> float | None:
+    deadline = UPDATE_DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def budget_timeout(default: float) -> float:
+    left = time_left()
+    if left is None:
+        return default
+    return max(UPSTREAM_MIN_TIMEOUT, min(default, left))
+
+
+def budget_allows(seconds: float = OPTIONAL_MIN_BUDGET) -> bool:
+    left = time_left()
+    return left is None or left >= seconds
+
+
+# Búsquedas saltadas o fuera de plazo durante la resolución en curso. Un
+# resultado armado con saltos está incompleto y no debe cachearse ni compartirse.
+UPDATE_SKIPS: contextvars.ContextVar[list | None] = contextvars.ContextVar("update_skips", default=None)
+
+
+def mark_skipped(what: str):
+    skipped = UPDATE_SKIPS.get()
+    if skipped is not None:
+        skipped.append(what)
+
+
+@contextlib.contextmanager
+def track_skips():
+    """Recoge en una lista los mark_skipped() de este bloque (y de los tasks que lance)."""
+    parent = UPDATE_SKIPS.get()
+    skipped: list[str] = []
+    token = UPDATE_SKIPS.set(skipped)
+    try:
+        yield skipped
+    finally:
+        UPDATE_SKIPS.reset(token)
+        if parent is not None:
+            parent.extend(skipped)
+
+
+def _approx_size(value, _depth: int = 0) -> int:
+    # Estimación barata del tamaño residente; suficiente para presupuestar caches.
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(_approx_size(k, _depth + 1) + _approx_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_approx_size(x, _depth + 1) for x in value)
+    return size
+
+
+class TTLCache:
+    """Cache LRU con TTL por entrada y presupuesto de bytes por namespace."""
+
+    def __init__(self, name: str, max_bytes: int, max_items: int, persist: bool = True):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.persist = persist
+        self.nbytes = 0
+        self.evictions = 0
+        self.hits = 0
+        self.neg_hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, tuple[float, object, int]] = OrderedDict()
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def lookup(self, key: str):
+        """Devuelve el valor guardado (None = negativo cacheado) o MISS."""
+        item = self._data.get(key)
+        if item is not None and item[0] < now_ts():
+            self.pop(key)
+            item = None
+        if item is None:
+            self.misses += 1
+            return MISS
+        self._data.move_to_end(key)
+        if item[1] is None:
+            self.neg_hits += 1
+        else:
+            self.hits += 1
+        return item[1]
+
+    def get(self, key: str):
+        value = self.lookup(key)
+        return None if value is MISS else value
+
+    def set(self, key: str, value, ttl: int):
+        expires_at = now_ts() + ttl
+        self._store(key, value, expires_at)
+        if self.persist and DISK_CACHE is not None:
+            DISK_CACHE.put(self.name, key, value, expires_at)
+
+    def _store(self, key: str, value, expires_at: float):
+        size = _approx_size(key) + _approx_size(value)
+        self.pop(key)
+        if size > self.max_bytes:
+            return
+        self._data[key] = (expires_at, value, size)
+        self.nbytes += size
+        while self._data and (self.nbytes > self.max_bytes or len(self._data) > self.max_items):
+            _, (_, _, old_size) = self._data.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+
+    def pop(self, key: str):
+        item = self._data.pop(key, None)
+        if item is None:
+            return None
+        self.nbytes -= item[2]
+        return item[1]
+
+    def sweep(self) -> int:
+        now = now_ts()
+        expired = [k for k, (exp, _, _) in self._data.items() if exp < now]
+        for k in expired:
+            self.pop(k)
+        return len(expired)
+
+
+CACHES: dict[str, TTLCache] = {}
+MISS = object()
+
+
+class DiskCache:
+    """Segundo nivel en SQLite (WAL): precarga al arrancar y escritura diferida.
+
+    Nunca se lee en el event loop: las filas vivas se cargan una vez en un
+    hilo (preload_disk_cache) y a partir de ahí solo se escribe por lotes.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str], tuple[float, str]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "ns TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (ns, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def load(self) -> list[tuple[str, str, float, object]]:
+        # las que vencen antes primero: al volcarlas en el LRU quedan como las más frías
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ns, key, expires_at, value FROM cache WHERE expires_at >= ? ORDER BY expires_at",
+                (now_ts(),),
+            ).fetchall()
+        out = []
+        for ns, key, exp, raw in rows:
+            try:
+                out.append((ns, key, exp, json.loads(raw)))
+            except ValueError:
+                continue
+        return out
+
+    def put(self, ns: str, key: str, value, expires_at: float):
+        try:
+            raw = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return
+        self._pending[(ns, key)] = (expires_at, raw)
+
+    def take_pending(self) -> dict:
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def write(self, batch: dict) -> int:
+        if not batch:
+            return 0
+        rows = [(ns, key, exp, raw) for (ns, key), (exp, raw) in batch.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def purge(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now_ts(),)).rowcount
+
+    def close(self):
+        self.write(self.take_pending())
+        with self._lock:
+            self._conn.close()
+
+
+DISK_CACHE: DiskCache | None = None
+
+
+def open_disk_cache():
+    global DISK_CACHE
+    if not CACHE_DB_PATH or DISK_CACHE is not None:
+        return
+    try:
+        DISK_CACHE = DiskCache(CACHE_DB_PATH)
+        purged = DISK_CACHE.purge()
+        log.info(f"Cache en disco: {CACHE_DB_PATH} ({purged} expirados purgados)")
+    except Exception as e:
+        log.warning(f"No pude abrir cache en disco {CACHE_DB_PATH}: {e}")
+        DISK_CACHE = None
+
+
+async def preload_disk_cache():
+    if DISK_CACHE is None:
+        return
+    try:
+        rows = await asyncio.to_thread(DISK_CACHE.load)
+    except Exception as e:
+        log.warning(f"cache en disco: fallo al precargar: {e}")
+        return
+    loaded = 0
+    for ns, key, exp, value in rows:
+        cache = CACHES.get(ns)
+        if cache is not None and cache.persist:
+            cache._store(key, value, exp)
+            loaded += 1
+    log.info(f"Cache en disco: {loaded} entradas precargadas en memoria")
+
+
+def close_disk_cache():
+    global DISK_CACHE
+    if DISK_CACHE is not None:
+        try:
+            DISK_CACHE.close()
+        except Exception as e:
+            log.warning(f"No pude cerrar cache en disco: {e}")
+        DISK_CACHE = None
+
+
+async def disk_cache_flusher():
+    while DISK_CACHE is not None:
+        await asyncio.sleep(CACHE_DB_FLUSH_INTERVAL)
+        disk = DISK_CACHE
+        if disk is None:
+            return
+        try:
+            await asyncio.to_thread(disk.write, disk.take_pending())
+        except Exception as e:
+            log.warning(f"cache en disco: fallo al escribir: {e}")
+
+
+def ttl_get(cache: TTLCache, key: str):
+    return cache.get(key)
+
+
+def ttl_lookup(cache: TTLCache, key: str):
+    return cache.lookup(key)
+
+
+def ttl_set(cache: TTLCache, key: str, value, ttl: int):
+    cache.set(key, value, ttl)
+
+
+def cache_stats() -> dict:
+    return {
+        name: {
+            "items": len(c),
+            "bytes": c.nbytes,
+            "hits": c.hits,
+            "neg_hits": c.neg_hits,
+            "misses": c.misses,
+            "evictions": c.evictions,
+        }
+        for name, c in CACHES.items()
+    }
+
+
+async def gather_within(jobs: dict, timeout: float, job_timeout: float | None = None) -> dict:
+    """Lanza todos los jobs a la vez y devuelve {nombre: resultado} de los que
+    terminaron dentro del plazo total (y de job_timeout, si se da), en el mismo
+    orden de `jobs`. Los que no alcanzan se cancelan; los que fallan quedan
+    fuera del dict igual que los atrasados."""
+    if not jobs:
+        return {}
+    if job_timeout is not None:
+        jobs = {name: asyncio.wait_for(coro, job_timeout) for name, coro in jobs.items()}
+    timeout = budget_timeout(timeout)
+    tasks = {name: asyncio.ensure_future(coro) for name, coro in jobs.items()}
+    try:
+        await asyncio.wait(tasks.values(), timeout=timeout)
+    finally:
+        for t in tasks.values():
+            if not t.done():
+                t.cancel()
+    out = {}
+    for name, t in tasks.items():
+        if not t.done() or t.cancelled() or isinstance(t.exception(), asyncio.TimeoutError):
+            log.debug(f"{name}: fuera de plazo ({timeout}s)")
+            mark_skipped(name)
+        elif t.exception() is not None:
+            log.debug(f"{name} fail: {t.exception()}")
+        else:
+            out[name] = t.result()
+    return out
+
+
+BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+
+def spawn(coro) -> asyncio.Task:
+    # Guarda una referencia fuerte para que el task no se pierda a medio camino.
+    task = asyncio.ensure_future(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+
+class AdaptiveLimiter:
+    """Token bucket + límite de concurrencia AIMD para una API con cuota.
+
+    Cada 2xx sube el límite en ~1 por ventana; cada 429 lo parte a la mitad y
+    bloquea nuevos permisos hasta que venza el Retry-After. acquire() no
+    espera más de max_wait: si devuelve False, el llamador debe usar su
+    camino alternativo en vez de hacer cola.
+    """
+
+    def __init__(
+        self, name: str, rate_per_s: float, burst: float, max_concurrency: int, max_wait: float,
+        adaptive: bool = True,
+    ):
+        self.name = name
+        self.rate = rate_per_s
+        self.burst = burst
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_wait = max_wait
+        self.adaptive = adaptive
+        # sin AIMD el límite queda fijo en max_concurrency
+        self.limit = 1.0 if adaptive else float(self.max_concurrency)
+        self.in_flight = 0
+        self.tokens = burst
+        self.blocked_until = 0.0
+        self.rejected = 0
+        self._updated = time.monotonic()
+        self._cond = asyncio.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _grant(self, now: float) -> bool:
+        self._refill(now)
+        if now >= self.blocked_until and self.in_flight < int(self.limit) and self.tokens >= 1:
+            self.tokens -= 1
+            self.in_flight += 1
+            return True
+        return False
+
+    async def try_acquire(self) -> bool:
+        """Turno inmediato o nada; no cuenta como rechazo (p. ej. un hedge que no sale)."""
+        async with self._cond:
+            return self._grant(time.monotonic())
+
+    async def acquire(self, max_wait: float | None = None) -> bool:
+        wait_cap = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        deadline = time.monotonic() + max(0.0, wait_cap)
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._grant(now):
+                    return True
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                # despertar cuando haya token / termine el bloqueo, o cuando alguien libere
+                ready_in = max(self.blocked_until - now, (1 - self.tokens) / self.rate if self.rate > 0 else remaining)
+                nap = min(remaining, ready_in) if ready_in > 0 else remaining
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=nap)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, outcome: str = "ok"):
+        async with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.adaptive and outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif self.adaptive and outcome == "throttled":
+                self.limit = max(1.0, self.limit / 2)
+            self._cond.notify_all()
+
+    def penalize(self, retry_after: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        self.tokens = 0
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            "rejected": self.rejected,
+        }
+
+
+def _retry_after_seconds(r: httpx.Response) -> float | None:
+    raw = (r.headers.get("Retry-After") or "").strip()
+    if not raw:
         return None
-    expires_at, value = item
-    if expires_at < now_ts():
-        cache.pop(key, None)
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
         return None
-    return value
 
 
-def ttl_set(cache: dict, key: str, value, ttl: int):
-    cache[key] = (now_ts() + ttl, value)
+# ---- Políticas por host: cuota, reintentos y circuit breaker ----
+class UpstreamUnavailable(Exception):
+    """Host con el circuito abierto o sin turno a tiempo: usar el camino alternativo sin cachear negativo."""
+
+
+class HostPolicy:
+    """Cuota fija + reintentos + circuit breaker para un host upstream.
+
+    Tras breaker_threshold fallos seguidos (red, timeout, 429 o 5xx) el circuito
+    se abre y las peticiones fallan al instante durante breaker_cooldown; luego
+    se deja pasar una sola petición de prueba (half_open) que lo cierra o lo
+    vuelve a abrir.
+    """
+
+    def __init__(
+        self, name: str, hosts: tuple[str, ...], rate_per_min: float, burst: float,
+        max_concurrency: int, max_retries: int, breaker_threshold: int, breaker_cooldown: float,
+        hedge: bool = False,
+    ):
+        self.name = name
+        self.hosts = hosts
+        self.limiter = AdaptiveLimiter(
+            name, rate_per_min / 60, burst, max_concurrency, UPSTREAM_MAX_QUEUE_WAIT, adaptive=False,
+        )
+        self.max_retries = max(1, max_retries)
+        self.breaker_threshold = max(1, breaker_threshold)
+        self.breaker_cooldown = breaker_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_at = 0.0
+        self.short_circuited = 0
+        self.hedge = hedge
+        self.latencies = deque(maxlen=200)
+        self.hedge_credit = 0.0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def matches(self, host: str) -> bool:
+        return any(host == h or host.endswith("." + h) for h in self.hosts)
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.breaker_cooldown:
+            self.state = "half_open"
+            self.trial_at = now
+            return True
+        # half_open: una prueba a la vez; si la prueba quedó colgada (cancelada), se permite otra
+        if self.state == "half_open" and now - self.trial_at >= self.breaker_cooldown:
+            self.trial_at = now
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            log.info(f"upstream {self.name}: circuito cerrado")
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.breaker_threshold:
+            if self.state != "open":
+                log.warning(
+                    f"upstream {self.name}: circuito abierto tras {self.failures} fallos; "
+                    f"sin peticiones durante {self.breaker_cooldown:.0f}s"
+                )
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    async def acquire(self):
+        if not self.allow():
+            raise UpstreamUnavailable(f"{self.name}: circuito abierto")
+        left = time_left()
+        max_wait = None if left is None else left - UPSTREAM_MIN_TIMEOUT
+        if not await self.limiter.acquire(max_wait):
+            raise UpstreamUnavailable(f"{self.name}: sin turno")
+
+    def hedge_delay(self) -> float | None:
+        """p95 de las latencias recientes, o None si no hay hedging / datos suficientes."""
+        if not self.hedge or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return max(HEDGE_MIN_DELAY, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def can_hedge(self) -> bool:
+        # cada petición primaria aporta HEDGE_MAX_RATIO de crédito; un hedge gasta 1
+        return self.hedge_credit >= 1
+
+    def take_hedge(self):
+        # solo una vez conseguido el turno: un hedge que no sale no gasta crédito
+        self.hedge_credit = max(0.0, self.hedge_credit - 1)
+        self.hedged += 1
+
+    def stats(self) -> dict:
+        out = {
+            "state": self.state,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            **self.limiter.stats(),
+        }
+        if self.hedge:
+            out.update(hedge_delay=self.hedge_delay(), hedged=self.hedged, hedge_wins=self.hedge_wins)
+        return out
+
+
+def _host_policy(
+    prefix: str, hosts: tuple[str, ...], rate_per_min: float, burst: float,
+    max_concurrency: int, max_retries: int, hedge: bool = False,
+) -> HostPolicy:
+    def env(key: str, default):
+        raw = os.environ.get(f"{prefix}_{key}")
+        if raw is None:
+            return default
+        if isinstance(default, bool):
+            return raw.strip().lower() not in ("0", "false", "no")
+        return type(default)(raw)
+
+    return HostPolicy(
+        prefix.lower(),
+        hosts,
+        env("RATE_PER_MIN", float(rate_per_min)),
+        env("BURST", float(burst)),
+        env("MAX_CONCURRENCY", max_concurrency),
+        env("MAX_RETRIES", max_retries),
+        env("BREAKER_THRESHOLD", UPSTREAM_BREAKER_THRESHOLD),
+        env("BREAKER_COOLDOWN", UPSTREAM_BREAKER_COOLDOWN),
+        env("HEDGE", hedge),
+    )
+
+
+# Odesli no está aquí: tiene su propio limitador adaptativo (ODESLI_LIMITER).
+HOST_POLICIES = {
+    p.name: p for p in (
+        _host_policy("DDG", ("duckduckgo.com",), 30, 5, 3, 1),
+        _host_policy("ITUNES", ("itunes.apple.com",), 60, 10, 4, 2, hedge=True),
+        _host_policy("SPOTIFY", ("open.spotify.com",), 120, 10, 6, 2, hedge=True),
+        _host_policy("MUSIXMATCH", ("api.musixmatch.com",), 60, 5, 3, 2),
+        _host_policy("STANDS4", ("stands4.com",), 30, 3, 2, 1),
+        _host_policy("SETLISTFM", ("api.setlist.fm",), 60, 2, 2, 2),
+    )
+}
+
+
+def policy_for(url: str) -> HostPolicy | None:
+    host = (urlparse(url).hostname or "").lower()
+    for policy in HOST_POLICIES.values():
+        if policy.matches(host):
+            return policy
+    return None
+
+
+def _is_upstream_failure(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+async def _timed_get(policy: HostPolicy, url: str, params, headers, timeout: float) -> httpx.Response:
+    started = time.monotonic()
+    r = await get_http_client().get(url, params=params, headers=headers, timeout=http_timeout(timeout))
+    policy.latencies.append(time.monotonic() - started)
+    return r
+
+
+async def _hedge_get(policy: HostPolicy, url: str, params, headers, timeout: float) -> httpx.Response:
+    try:
+        return await _timed_get(policy, url, params, headers, timeout)
+    finally:
+        await policy.limiter.release()
+
+
+async def _hedged_get(policy: HostPolicy, url: str, params, headers, timeout: float) -> httpx.Response:
+    """Petición primaria y, si tarda más que el p95 del host, una copia; gana la primera respuesta."""
+    delay = policy.hedge_delay()
+    if delay is None or not budget_allows(delay + UPSTREAM_MIN_TIMEOUT):
+        return await _timed_get(policy, url, params, headers, timeout)
+    policy.hedge_credit = min(5.0, policy.hedge_credit + HEDGE_MAX_RATIO)
+    primary = asyncio.ensure_future(_timed_get(policy, url, params, headers, timeout))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        # el hedge usa un turno propio del limitador, sin esperar: nunca se salta la cuota
+        if not done and policy.can_hedge() and await policy.limiter.try_acquire():
+            policy.take_hedge()
+            pending.add(asyncio.ensure_future(_hedge_get(policy, url, params, headers, timeout)))
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    if t is not primary:
+                        policy.hedge_wins += 1
+                    return t.result()
+                error = t.exception()
+        raise error
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+async def upstream_get(url: str, *, params=None, headers=None, timeout: float = 10) -> httpx.Response:
+    """GET con la política del host: turno, reintentos con backoff y circuit breaker.
+
+    Lanza UpstreamUnavailable si el host está caído o saturado; los demás
+    errores de red se propagan tras agotar los reintentos.
+    """
+    client = get_http_client()
+    policy = policy_for(url)
+    if policy is None:
+        return await client.get(url, params=params, headers=headers, timeout=http_timeout(timeout))
+
+    for attempt in range(policy.max_retries):
+        await policy.acquire()
+        outcome = "error"
+        try:
+            r = await _hedged_get(policy, url, params, headers, timeout)
+            outcome = "throttled" if r.status_code == 429 else "ok"
+        except httpx.TransportError:
+            policy.record_failure()
+            if attempt + 1 >= policy.max_retries:
+                raise
+            r = None
+        finally:
+            await policy.limiter.release(outcome)
+
+        if r is not None:
+            if not _is_upstream_failure(r.status_code):
+                policy.record_success()
+                return r
+            policy.record_failure()
+            if r.status_code == 429:
+                policy.limiter.penalize(_retry_after_seconds(r) or 2 * (attempt + 1))
+            if attempt + 1 >= policy.max_retries:
+                return r
+            log.debug(f"upstream {policy.name} {r.status_code}; reintento {attempt + 1}/{policy.max_retries}")
+
+        # backoff exponencial con jitter; tras un 429 la espera la impone el limitador
+        wait_s = 0.0
+        if r is None or r.status_code != 429:
+            wait_s = min(0.5 * 2 ** attempt, 4) * random.uniform(0.5, 1.5)
+        if not budget_allows(wait_s + UPSTREAM_MIN_TIMEOUT):
+            if r is not None:
+                return r
+            raise UpstreamUnavailable(f"{policy.name}: sin presupuesto para reintentar")
+        await asyncio.sleep(wait_s)
+    raise UpstreamUnavailable(f"{policy.name}: sin reintentos")
+
+
+# ---- Single-flight: una sola petición upstream por clave de cache ----
+INFLIGHT: dict[str, asyncio.Task] = {}
+
+
+async def _flight(fn, *args):
+    # el task compartido no hereda el plazo ni la lista de saltos del primer llamador
+    UPDATE_DEADLINE.set(None)
+    UPDATE_SKIPS.set(None)
+    with track_skips() as skipped:
+        result = await fn(*args)
+    return result, tuple(skipped)
+
+
+async def single_flight(cache: TTLCache, key: str, fn, *args):
+    flight_key = f"{cache.name}::{key}"
+    task = INFLIGHT.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(_flight(fn, *args))
+        INFLIGHT[flight_key] = task
+        task.add_done_callback(lambda _t: INFLIGHT.pop(flight_key, None))
+    # shield: si un llamador se cancela, el resto sigue esperando el mismo resultado
+    result, skipped = await asyncio.shield(task)
+    # cada llamador (también los que se unieron tarde) ve los saltos del task compartido
+    for what in skipped:
+        mark_skipped(what)
+    return result
+
+
+async def cache_sweeper():
+    while True:
+        await asyncio.sleep(CACHE_SWEEP_INTERVAL)
+        for cache in list(CACHES.values()):
+            try:
+                removed = cache.sweep()
+                if removed:
+                    log.debug(f"cache {cache.name}: {removed} expirados, {len(cache)} vivos, {cache.nbytes} bytes")
+            except Exception as e:
+                log.warning(f"cache sweeper {cache.name}: {e}")
+        if DISK_CACHE is not None:
+            try:
+                await asyncio.to_thread(DISK_CACHE.purge)
+            except Exception as e:
+                log.warning(f"cache en disco: fallo al purgar: {e}")
+        log.info("cache stats: " + "; ".join(
+            f"{n} hit={st['hits']} neg={st['neg_hits']} miss={st['misses']}"
+            for n, st in cache_stats().items()
+        ))
+
+
+def _http2_available() -> bool:
+    if not HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        log.warning("HTTP2=1 pero falta el paquete h2 (httpx[http2]); se usa HTTP/1.1")
+        return False
+    return True
+
+
+def http_pool_size() -> int:
+    # un turno por cada slot de concurrencia configurado + Odesli + margen para hosts sin política
+    return (
+        sum(p.limiter.max_concurrency for p in HOST_POLICIES.values())
+        + ODESLI_MAX_CONCURRENCY
+        + HTTP_EXTRA_CONNECTIONS
+    )
+
+
+def http_timeout(read: float = HTTP_READ_TIMEOUT) -> httpx.Timeout:
+    """Timeout por fases: connect y pool cortos, read recortado al presupuesto del update."""
+    read = budget_timeout(read)
+    return httpx.Timeout(read, connect=min(HTTP_CONNECT_TIMEOUT, read), pool=min(HTTP_POOL_TIMEOUT, read))
 
 
 def get_http_client() -> httpx.AsyncClient:
     global HTTP_CLIENT
     if HTTP_CLIENT is None:
-        limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        pool = http_pool_size()
+        limits = httpx.Limits(
+            max_connections=pool,
+            max_keepalive_connections=pool,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
         headers = {
             "User-Agent": "psybros-bot/2.0",
             "Accept-Language": f"es-{COUNTRY},es;q=0.9,en;q=0.8",
         }
         HTTP_CLIENT = httpx.AsyncClient(
-            timeout=15,
+            timeout=http_timeout(),
             limits=limits,
             headers=headers,
             follow_redirects=True,
+            http2=_http2_available(),
         )
     return HTTP_CLIENT
 
 
+def warmup_urls() -> list[str]:
+    urls = [
+        "https://api.song.link/",
+        "https://open.spotify.com/",
+        "https://itunes.apple.com/",
+        "https://music.apple.com/",
+        "https://duckduckgo.com/",
+    ]
+    if SETLIST_FM_API_KEY:
+        urls.append("https://api.setlist.fm/")
+    if MUSIXMATCH_KEY:
+        urls.append("https://api.musixmatch.com/")
+    return urls
+
+
+async def warm_up_http_client():
+    """Abre (DNS + TCP + TLS) una conexión por host conocido para que el primer
+    usuario tras el arranque no pague los handshakes. Con HTTP_WARMUP_INTERVAL
+    se repite para que el pool no se enfríe en horas sin tráfico."""
+    while True:
+        client = get_http_client()
+
+        async def touch(url: str):
+            started = time.monotonic()
+            try:
+                # sin políticas: un HEAD no debe gastar cuota ni abrir circuitos
+                await client.head(url, timeout=http_timeout(HTTP_CONNECT_TIMEOUT * 2))
+            except Exception as e:
+                log.debug(f"warm-up {url}: {e}")
+                return None
+            return time.monotonic() - started
+
+        urls = warmup_urls()
+        took = await asyncio.gather(*(touch(u) for u in urls))
+        log.info("conexiones precalentadas: " + ", ".join(
+            f"{urlparse(u).hostname}={'fallo' if t is None else f'{t * 1000:.0f}ms'}"
+            for u, t in zip(urls, took)
+        ))
+        if HTTP_WARMUP_INTERVAL <= 0:
+            return
+        await asyncio.sleep(HTTP_WARMUP_INTERVAL)
+
+
+STREAM_MATCH_OVERLAP = 64 * 1024
+
+
+async def stream_fetch(
+    url: str,
+    markers: tuple[re.Pattern, ...],
+    need_all: bool = True,
+    max_bytes: int = STREAM_MAX_BYTES,
+    timeout: float = 15,
+) -> tuple[int, str]:
+    """Descarga por chunks y corta la conexión en cuanto aparecen los marcadores.
+
+    Con need_all=True espera a todos los marcadores; si no, basta con uno.
+    Nunca lee más de max_bytes. Devuelve (status, texto leído hasta el corte).
+    """
+    pending = list(markers)
+    text = ""
+    client = get_http_client()
+    # sin reintentos: basta con respetar turno y circuito del host
+    policy = policy_for(url)
+    if policy is not None:
+        await policy.acquire()
+    outcome = "error"
+    try:
+        async with client.stream("GET", url, timeout=http_timeout(timeout)) as r:
+            outcome = "throttled" if r.status_code == 429 else "ok"
+            if policy is not None:
+                if _is_upstream_failure(r.status_code):
+                    policy.record_failure()
+                else:
+                    policy.record_success()
+            if r.status_code != 200:
+                return r.status_code, ""
+            async for chunk in r.aiter_text():
+                # solapamiento para marcadores partidos entre chunks
+                start = max(0, len(text) - STREAM_MATCH_OVERLAP)
+                text += chunk
+                pending = [p for p in pending if not p.search(text, start)]
+                if not pending or (not need_all and len(pending) < len(markers)):
+                    break
+                if len(text) >= max_bytes:
+                    break
+            return r.status_code, text
+    except httpx.TransportError:
+        if policy is not None:
+            policy.record_failure()
+        raise
+    finally:
+        if policy is not None:
+            await policy.limiter.release(outcome)
+
+
 # ====== Utils ======
 def _norm_text(s: str) -> str:
     if not s:
@@ -211,20 +1112,141 @@ def sort_keys(links: dict) -> list[str]:
     return fav_present + others_sorted
 
 
-def normalize_music_url(url: str) -> str:
-    try:
-        p = urlparse(url)
-        scheme = p.scheme or "https"
-        netloc = p.netloc
-        path = p.path or ""
-        fragment = ""
+# ---- URL canónica por plataforma (clave de cache) ----
+# Parámetros que solo rastrean el origen del enlace compartido; nunca cambian el contenido.
+TRACKING_PARAMS = frozenset({
+    "si", "feature", "fbclid", "gclid", "igshid", "ref", "ref_src", "share", "nd", "context",
+    "pp", "app", "ls", "uo", "at", "ct", "itsct", "itscg", "mt", "_branch_match_id", "_branch_referrer",
+    "deferredfl", "utm_source", "utm_medium", "utm_campaign", "utm_content", "utm_term",
+})
 
-        if "spotify.com" in netloc.lower():
-            path = re.sub(r"^/intl-[a-z]{2}(?=/)", "", path, flags=re.I)
-            path = re.sub(r"^/intl-[a-z]{2}-[a-z]{2}(?=/)", "", path, flags=re.I)
-            return urlunparse((scheme, netloc, path, "", "", fragment))
 
-        return urlunparse((scheme, netloc, path, p.params, p.query, fragment))
+def _filter_query(query: str, keep: tuple[str, ...] | None = None) -> str:
+    # keep=None: todo salvo rastreo; keep=(...): solo esos parámetros
+    pairs = []
+    for part in query.split("&"):
+        if not part:
+            continue
+        name = unquote(part.split("=", 1)[0]).lower()
+        if keep is not None and name not in keep:
+            continue
+        if keep is None and (name in TRACKING_PARAMS or name.startswith("utm_")):
+            continue
+        pairs.append(part)
+    return "&".join(pairs)
+
+
+def _canon_spotify(host: str, path: str, query: str) -> tuple[str, str, str]:
+    if host not in ("spotify.com", "open.spotify.com", "play.spotify.com"):
+        return _canon_generic(host, path, query)
+    path = re.sub(r"^/intl-[a-z]{2}(?:-[a-z]{2})?(?=/)", "", path, flags=re.I)
+    path = re.sub(r"^/embed(?=/)", "", path)
+    return "open.spotify.com", path, ""
+
+
+def _canon_youtube(host: str, path: str, query: str) -> tuple[str, str, str]:
+    if host == "youtu.be":
+        vid = path.strip("/").split("/")[0]
+        return ("www.youtube.com", "/watch", f"v={vid}") if vid else (host, path, "")
+    if host not in ("youtube.com", "music.youtube.com"):
+        return _canon_generic(host, path, query)
+    m = re.match(r"^/(?:shorts|embed|live|v)/([\w-]{6,})", path)
+    if m:
+        return "www.youtube.com", "/watch", f"v={m.group(1)}"
+    if path == "/watch":
+        vid = (parse_qs(query).get("v") or [""])[0]
+        if vid:
+            # mismo vídeo en youtube.com y music.youtube.com: una sola clave
+            return "www.youtube.com", "/watch", f"v={vid}"
+    # playlist/browse/channel: music.youtube.com conserva su host (los MPREb solo existen ahí)
+    host = "music.youtube.com" if host.startswith("music.") else "www.youtube.com"
+    return host, path, _filter_query(query, ("list",))
+
+
+def _canon_apple(host: str, path: str, query: str) -> tuple[str, str, str]:
+    if host not in ("music.apple.com", "geo.music.apple.com", "itunes.apple.com"):
+        return _canon_generic(host, path, query)
+    # región y slug se conservan: los usan _extract_apple_entity y la regionalización
+    return "music.apple.com", path, _filter_query(query, ("i",))
+
+
+def _canon_deezer(host: str, path: str, query: str) -> tuple[str, str, str]:
+    # link.deezer.com (enlaces cortos), api. y widget. no existen bajo www.
+    if host != "deezer.com":
+        return _canon_generic(host, path, query)
+    path = re.sub(r"^/[a-z]{2}(?=/(?:track|album|artist|playlist)/)", "", path)
+    return "www.deezer.com", path, ""
+
+
+def _canon_tidal(host: str, path: str, query: str) -> tuple[str, str, str]:
+    if host not in ("tidal.com", "listen.tidal.com"):
+        return _canon_generic(host, path, query)
+    path = re.sub(r"/u$", "", path)
+    if not path.startswith("/browse/"):
+        path = "/browse" + path
+    return "tidal.com", path, ""
+
+
+def _canon_soundcloud(host: str, path: str, query: str) -> tuple[str, str, str]:
+    # on. (enlaces cortos), api. y w. (reproductor) conservan su host
+    if host != "soundcloud.com":
+        return _canon_generic(host, path, query)
+    return "soundcloud.com", path, ""
+
+
+def _canon_bandcamp(host: str, path: str, query: str) -> tuple[str, str, str]:
+    return host, path, ""
+
+
+def _canon_anghami(host: str, path: str, query: str) -> tuple[str, str, str]:
+    if host not in ("anghami.com", "play.anghami.com"):
+        return _canon_generic(host, path, query)
+    return "play.anghami.com", path, _filter_query(query)
+
+
+def _canon_generic(host: str, path: str, query: str) -> tuple[str, str, str]:
+    return host, path, _filter_query(query)
+
+
+# (sufijo de host, regla); el primero que coincide gana. Cubre todo MUSIC_DOMAINS.
+URL_CANON_RULES = (
+    ("spotify.com", _canon_spotify),
+    ("youtu.be", _canon_youtube),
+    ("youtube.com", _canon_youtube),
+    ("music.apple.com", _canon_apple),
+    ("itunes.apple.com", _canon_apple),
+    ("deezer.com", _canon_deezer),
+    ("tidal.com", _canon_tidal),
+    ("soundcloud.com", _canon_soundcloud),
+    ("bandcamp.com", _canon_bandcamp),
+    ("anghami.com", _canon_anghami),
+)
+
+
+def normalize_music_url(url: str) -> str:
+    """URL canónica: misma obra -> misma cadena, sea cual sea la variante compartida.
+
+    Quita tokens de compartir (si, utm_*, feature...), unifica hosts (youtu.be,
+    m., music./www., itunes/geo) y aplica las reglas de cada plataforma. Los
+    demás subdominios (enlaces cortos, api., embed.) se dejan como están: el
+    resultado sigue siendo una URL válida para Odesli y para descargar la página.
+    """
+    try:
+        p = urlparse(url.strip())
+        host = (p.hostname or "").lower()
+        if not host:
+            return url
+        if host.startswith("m.") or host.startswith("www."):
+            host = host.split(".", 1)[1]
+        path = re.sub(r"/{2,}", "/", p.path or "/")
+        if len(path) > 1:
+            path = path.rstrip("/")
+        rule = next(
+            (fn for suffix, fn in URL_CANON_RULES if host == suffix or host.endswith("." + suffix)),
+            _canon_generic,
+        )
+        netloc, path, query = rule(host, path, p.query)
+        return urlunparse(("https", netloc, path, "", query, ""))
     except Exception:
         return url
 
@@ -267,12 +1289,16 @@ def regionalize_links_for_track(links: dict) -> dict:
 
 
 # ===== Spotify precise resolver =====
-SPOTIFY_CACHE: dict[str, tuple[float, object]] = {}
-GENERIC_CACHE: dict[str, tuple[float, object]] = {}
-ODESLI_CACHE: dict[str, tuple[float, object]] = {}
-LYRICS_CACHE: dict[str, tuple[float, object]] = {}
-SETLIST_CACHE: dict[str, tuple[float, object]] = {}
-APPLE_CACHE: dict[str, tuple[float, object]] = {}
+SPOTIFY_CACHE = TTLCache("spotify", CACHE_MAX_BYTES, CACHE_MAX_ITEMS)
+GENERIC_CACHE = TTLCache("generic", GENERIC_CACHE_MAX_BYTES, CACHE_MAX_ITEMS * 4)
+ODESLI_CACHE = TTLCache("odesli", CACHE_MAX_BYTES, CACHE_MAX_ITEMS)
+LYRICS_CACHE = TTLCache("lyrics", CACHE_MAX_BYTES, CACHE_MAX_ITEMS)
+SETLIST_CACHE = TTLCache("setlist", CACHE_MAX_BYTES, CACHE_MAX_ITEMS)
+APPLE_CACHE = TTLCache("apple", CACHE_MAX_BYTES, CACHE_MAX_ITEMS)
+# Entidad canónica: "url::<url>" -> id y "entity::<id>" -> links + metadatos
+ENTITY_CACHE = TTLCache("entities", CACHE_MAX_BYTES, CACHE_MAX_ITEMS * 4)
+# (artista, título) normalizados -> links; compartido entre setlists y enlaces sueltos
+SONG_INDEX = TTLCache("songs", CACHE_MAX_BYTES, CACHE_MAX_ITEMS * 4)
 
 
 DDG_HTML = "https://duckduckgo.com/html/?q={q}"
@@ -324,23 +1350,6 @@ def _extract_apple_entity(url: str) -> tuple[str | None, str | None]:
     return None, None
 
 
-async def _apple_html(url: str) -> str | None:
-    cache_key = f"apple_html::{normalize_music_url(url)}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
-        return cached
-    try:
-        client = get_http_client()
-        r = await client.get(normalize_music_url(url), timeout=15)
-        if r.status_code == 200:
-            ttl_set(GENERIC_CACHE, cache_key, r.text, GENERIC_CACHE_TTL)
-            return r.text
-    except Exception as e:
-        log.debug(f"apple html fail: {e}")
-    ttl_set(GENERIC_CACHE, cache_key, None, 900)
-    return None
-
-
 def _parse_apple_title(raw: str) -> tuple[str | None, str | None, str | None]:
     raw = _norm_text(raw)
     raw = re.sub(r"\s*on Apple Music$", "", raw, flags=re.I)
@@ -363,10 +1372,13 @@ def _parse_apple_title(raw: str) -> tuple[str | None, str | None, str | None]:
 
 async def _apple_best_metadata(url: str) -> dict:
     normalized = normalize_music_url(url)
-    cached = ttl_get(APPLE_CACHE, normalized)
-    if cached is not None:
+    cached = ttl_lookup(APPLE_CACHE, normalized)
+    if cached is not MISS:
         return cached
+    return await single_flight(APPLE_CACHE, normalized, _apple_best_metadata_fetch, normalized)
+
 
+async def _apple_best_metadata_fetch(normalized: str) -> dict:
     entity_type, entity_id = _extract_apple_entity(normalized)
     data = {
         "entity_type": entity_type,
@@ -378,12 +1390,12 @@ async def _apple_best_metadata(url: str) -> dict:
         "apple_url": normalized,
     }
 
-    html_text = await _apple_html(normalized)
-    if html_text:
-        title_tag = _extract_title_tag(html_text)
-        og_title = _extract_meta_content(html_text, "og:title")
-        og_desc = _extract_meta_content(html_text, "og:description")
-        og_image = _extract_meta_content(html_text, "og:image")
+    page = await _page_meta(normalized, "apple")
+    if page:
+        title_tag = page.get("title")
+        og_title = page.get("og:title")
+        og_desc = page.get("og:description")
+        og_image = page.get("og:image")
         if og_image:
             data["cover"] = og_image
 
@@ -402,7 +1414,7 @@ async def _apple_best_metadata(url: str) -> dict:
                 if artist_guess and not _safe_eq(artist_guess, data.get("title")):
                     data["artist"] = artist_guess
 
-        records = _extract_jsonld(html_text)
+        records = page.get("jsonld") or []
         rec = _jsonld_music_record(records)
         if rec:
             rec_type = ((rec.get("@type") if not isinstance(rec.get("@type"), list) else (rec.get("@type") or [None])[0]) or "").lower()
@@ -497,6 +1509,10 @@ async def spotify_search_artist(artist: str) -> str | None:
     return f"https://open.spotify.com/search/{quote(q_artist)}"
 
 
+async def _first_of(coro):
+    return (await coro)[0]
+
+
 async def complete_links_with_fallbacks(links: dict | None, entity_type: str | None, title: str | None, artist: str | None, album: str | None = None) -> dict:
     links = normalize_links(links or {})
     entity_type = (entity_type or "track").lower()
@@ -504,42 +1520,42 @@ async def complete_links_with_fallbacks(links: dict | None, entity_type: str | N
     artist = _clean_artist(artist or "") or None
     album = _clean_title(album or "") or None
 
+    # Búsquedas remotas de las plataformas que faltan: se lanzan juntas y se
+    # mezclan en orden fijo; las URLs de búsqueda quedan como respaldo.
+    jobs: dict = {}
+    fallback: dict[str, str] = {}
+    wrap = {}
+
     if entity_type == "artist":
         if artist or title:
             name = artist or title
             if "spotify" not in links:
-                sp = await spotify_search_artist(name)
-                if sp:
-                    links["spotify"] = {"url": sp}
+                jobs["spotify"] = spotify_search_artist(name)
+                fallback["spotify"] = f"https://open.spotify.com/search/{quote(name)}"
             if "youtube" not in links:
                 links["youtube"] = {"url": f"https://www.youtube.com/results?search_query={quote_plus(name)}"}
             if "youtubemusic" not in links:
                 links["youtubemusic"] = {"url": f"https://music.youtube.com/search?q={quote_plus(name)}"}
             if "applemusic" not in links:
-                am = await apple_search_artist(name)
-                if am:
-                    links["applemusic"] = {"url": _regionalize_apple(am)}
-        return links
+                jobs["applemusic"] = apple_search_artist(name)
+                wrap["applemusic"] = _regionalize_apple
 
-    if entity_type == "album":
+    elif entity_type == "album":
         album_name = title or album
         if album_name:
             if "spotify" not in links:
-                sp = await spotify_search_album(artist or "", album_name)
-                if sp:
-                    links["spotify"] = {"url": sp}
+                jobs["spotify"] = spotify_search_album(artist or "", album_name)
+                fallback["spotify"] = "https://open.spotify.com/search/" + quote(f"album:{album_name} artist:{artist or ''}".strip())
             q = build_query(artist, album_name, kind="album")
             if q and "youtube" not in links:
                 links["youtube"] = {"url": f"https://www.youtube.com/results?search_query={quote_plus(q)}"}
             if q and "youtubemusic" not in links:
                 links["youtubemusic"] = {"url": f"https://music.youtube.com/search?q={quote_plus(q)}"}
             if "applemusic" not in links:
-                am = await apple_search_album(artist or "", album_name)
-                if am:
-                    links["applemusic"] = {"url": _regionalize_apple(am, for_album=True)}
-        return links
+                jobs["applemusic"] = apple_search_album(artist or "", album_name)
+                wrap["applemusic"] = lambda u: _regionalize_apple(u, for_album=True)
 
-    if entity_type == "playlist":
+    elif entity_type == "playlist":
         q = _clean_title(title or "playlist")
         if q and "spotify" not in links:
             links["spotify"] = {"url": f"https://open.spotify.com/search/{quote(q + ' playlist')}"}
@@ -551,37 +1567,123 @@ async def complete_links_with_fallbacks(links: dict | None, entity_type: str | N
             links["applemusic"] = {"url": f"https://music.apple.com/{COUNTRY.lower()}/search?term={quote_plus(q + ' playlist')}"}
         return links
 
-    q = build_query(artist, title, kind="track")
-    if title:
+    elif title:
+        q = build_query(artist, title, kind="track")
+        terms = _ddg_track_terms(artist, title)
         if "spotify" not in links:
-            sp = await spotify_search_track(artist or "", title)
-            if sp:
-                links["spotify"] = {"url": sp}
+            jobs["spotify"] = spotify_search_track(artist or "", title)
+            fallback["spotify"] = "https://open.spotify.com/search/" + quote(f"track:{title} artist:{artist or ''}".strip())
         if "youtube" not in links:
-            direct_yt = await _ddg_first_result(
-                f'site:youtube.com/watch "{_clean_title(title or "")}" "{_clean_artist(artist or "")}"',
-                ("youtube.com",),
-            )
-            links["youtube"] = {"url": direct_yt or f"https://www.youtube.com/results?search_query={quote_plus(q)}"}
+            jobs["youtube"] = ddg_site_result(terms, "youtube.com/watch", DDG_TRACK_SITES)
+            fallback["youtube"] = f"https://www.youtube.com/results?search_query={quote_plus(q)}"
         if "youtubemusic" not in links and q:
             links["youtubemusic"] = {"url": f"https://music.youtube.com/search?q={quote_plus(q)}"}
         if "applemusic" not in links:
-            am, _ = await apple_search_track(artist or "", title)
-            if am:
-                links["applemusic"] = {"url": _regionalize_apple(am)}
+            jobs["applemusic"] = _first_of(apple_search_track(artist or "", title))
+            wrap["applemusic"] = _regionalize_apple
         if "soundcloud" not in links and q:
-            direct_sc = await _ddg_first_result(
-                f'site:soundcloud.com/ "{_clean_title(title or "")}" "{_clean_artist(artist or "")}"',
-                ("soundcloud.com",),
-            )
-            links["soundcloud"] = {"url": direct_sc or f"https://soundcloud.com/search?q={quote_plus(q)}"}
-
+            jobs["soundcloud"] = ddg_site_result(terms, "soundcloud.com", DDG_TRACK_SITES)
+            fallback["soundcloud"] = f"https://soundcloud.com/search?q={quote_plus(q)}"
+
+    found = await gather_within(jobs, FALLBACK_DEADLINE, job_timeout=FALLBACK_PLATFORM_TIMEOUT)
+    for key in jobs:
+        url = found.get(key)
+        if url and key in wrap:
+            url = wrap[key](url)
+        url = url or fallback.get(key)
+        if url:
+            links[key] = {"url": url}
     return links
 
 
+# ---- Entidades canónicas: un registro por obra, sus URLs confirmadas apuntan a él ----
+SEARCH_URL_RE = re.compile(r"/search\b|[?&](?:search_query|q|term)=", re.I)
+
+
+def lookup_entity(url: str) -> dict | None:
+    entity_id = ttl_get(ENTITY_CACHE, f"url::{normalize_music_url(url)}")
+    return ttl_get(ENTITY_CACHE, f"entity::{entity_id}") if entity_id else None
+
+
+def remember_entity(url: str, links: dict, title: str | None, artist: str | None,
+                    cover: str | None, page_url: str | None,
+                    identity_urls: list[str] | tuple[str, ...] = (), ttl: int = ENTITY_CACHE_TTL) -> str:
+    """Guarda el resultado bajo la entidad de cualquiera de sus URLs ya conocidas
+    (o una nueva).
+
+    Solo la URL de entrada y identity_urls (links que da Odesli para esa misma
+    obra) identifican la entidad: son las únicas que se indexan y se usan para
+    encontrar una ya conocida. Los links adivinados por búsqueda (DDG, iTunes,
+    Spotify search) se guardan en el registro pero nunca unen dos obras.
+    """
+    urls = list(dict.fromkeys([normalize_music_url(url)] + [
+        normalize_music_url(u) for u in identity_urls
+        if u and not SEARCH_URL_RE.search(u)
+    ]))
+    known = (ttl_get(ENTITY_CACHE, f"url::{u}") for u in urls)
+    entity_id = next((i for i in known if i), None)
+    prev = ttl_get(ENTITY_CACHE, f"entity::{entity_id}") if entity_id else None
+    if prev and ttl < ENTITY_CACHE_TTL:
+        # resolución degradada: no pisa (ni acorta) un registro completo ya conocido
+        for u in urls:
+            if ttl_get(ENTITY_CACHE, f"url::{u}") is None:
+                ttl_set(ENTITY_CACHE, f"url::{u}", entity_id, ttl)
+        return entity_id
+    entity_id = entity_id or uuid.uuid4().hex
+    prev = prev or {}
+
+    ids = set(prev.get("ids") or ()) | set(urls)
+    merged = dict(prev.get("links") or {})
+    for k, info in links.items():
+        old_url = (merged.get(k) or {}).get("url") or ""
+        new_url = info.get("url") or ""
+        # un link directo ya conocido no se reemplaza por una URL de búsqueda,
+        # ni uno confirmado por Odesli por una conjetura
+        if old_url and not SEARCH_URL_RE.search(old_url) and SEARCH_URL_RE.search(new_url):
+            continue
+        if normalize_music_url(old_url) in ids and normalize_music_url(new_url) not in ids:
+            continue
+        merged[k] = info
+    record = {
+        "links": merged,
+        "ids": sorted(ids),
+        # armado con búsquedas saltadas: quien lo reutilice lo trata como incompleto
+        "partial": ttl < ENTITY_CACHE_TTL,
+        "title": title or prev.get("title"),
+        "artist": artist or prev.get("artist"),
+        "cover": cover or prev.get("cover"),
+        "page_url": page_url or prev.get("page_url"),
+    }
+    ttl_set(ENTITY_CACHE, f"entity::{entity_id}", record, ttl)
+    for u in urls:
+        ttl_set(ENTITY_CACHE, f"url::{u}", entity_id, ttl)
+    return entity_id
+
+
 async def resolve_generic_music_url(url: str) -> tuple[dict | None, str | None, str | None, str | None, str | None]:
+    entity = lookup_entity(url)
+    if entity:
+        if entity.get("partial"):
+            mark_skipped("entity")
+        return entity["links"], entity["title"], entity["artist"], entity["cover"], entity["page_url"]
+    with track_skips() as skipped:
+        links, title, artist_name, cover, page_url, identity_urls = await _resolve_generic_music_url(url)
+    if links:
+        # con búsquedas saltadas o fuera de plazo los links quedaron en URLs de búsqueda: TTL corto
+        ttl = 300 if skipped else ENTITY_CACHE_TTL
+        remember_entity(url, links, title, artist_name, cover, page_url, identity_urls, ttl)
+    return links, title, artist_name, cover, page_url
+
+
+async def _resolve_generic_music_url(url: str) -> tuple[dict | None, str | None, str | None, str | None, str | None, list[str]]:
+    """Como resolve_generic_music_url, más las URLs que identifican la obra.
+
+    Esas URLs son solo las que vienen de Odesli; en Spotify, donde todo lo
+    demás sale de búsquedas, no hay ninguna aparte de la URL de entrada.
+    """
     parsed = urlparse(url)
     host = parsed.netloc.lower()
+    identity_urls: list[str] = []
 
     if "spotify.com" in host:
         links, title, artist_name, cover, page_url = await resolve_spotify_links(url)
@@ -589,6 +1691,7 @@ async def resolve_generic_music_url(url: str) -> tuple[dict | None, str | None,
     else:
         links, title, artist_name, cover, page_url = await fetch_odesli(url)
         meta = {"entity_type": None, "album": None}
+        identity_urls = [info["url"] for info in (links or {}).values() if info.get("url")]
 
         if any(x in host for x in ["music.apple.com", "itunes.apple.com", "geo.music.apple.com"]):
             ameta = await _apple_best_metadata(url)
@@ -606,7 +1709,7 @@ async def resolve_generic_music_url(url: str) -> tuple[dict | None, str | None,
             album=meta.get("album"),
         )
 
-    return links, title, artist_name, cover, page_url
+    return links, title, artist_name, cover, page_url, identity_urls
 
 
 def _parse_spotify_title(raw: str) -> tuple[str | None, str | None, str | None]:
@@ -632,75 +1735,87 @@ def _parse_spotify_title(raw: str) -> tuple[str | None, str | None, str | None]:
     return None, None, raw or None
 
 
-async def _spotify_html(url: str) -> str | None:
-    cache_key = f"spotify_html::{normalize_music_url(url)}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
-        return cached
-    try:
-        client = get_http_client()
-        r = await client.get(normalize_music_url(url), timeout=15)
-        if r.status_code == 200:
-            ttl_set(GENERIC_CACHE, cache_key, r.text, GENERIC_CACHE_TTL)
-            return r.text
-    except Exception as e:
-        log.debug(f"spotify html fail: {e}")
-    ttl_set(GENERIC_CACHE, cache_key, None, 900)
-    return None
-
-
 async def _spotify_oembed(url: str) -> dict | None:
     cache_key = f"spotify_oembed::{normalize_music_url(url)}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
         return cached
     try:
-        client = get_http_client()
         oembed = f"https://open.spotify.com/oembed?url={quote(url, safe='')}"
-        r = await client.get(oembed, timeout=10)
+        r = await upstream_get(oembed, timeout=10)
         if r.status_code == 200:
             data = r.json() or {}
             ttl_set(GENERIC_CACHE, cache_key, data, GENERIC_CACHE_TTL)
             return data
+    except UpstreamUnavailable as e:
+        log.debug(f"spotify oembed omitido: {e}")
+        mark_skipped("spotify oembed")
+        return None
     except Exception as e:
         log.debug(f"spotify oembed fail: {e}")
     ttl_set(GENERIC_CACHE, cache_key, None, 900)
     return None
 
 
-def _extract_title_tag(html_text: str) -> str | None:
-    m = re.search(r"<title>(.*?)</title>", html_text or "", re.I | re.S)
-    return _norm_text(m.group(1)) if m else None
-
-
-def _extract_meta_content(html_text: str, prop: str) -> str | None:
-    patterns = [
-        rf'<meta[^>]+property=["\']{re.escape(prop)}["\'][^>]+content=["\']([^"\']+)["\']',
-        rf'<meta[^>]+content=["\']([^"\']+)["\'][^>]+property=["\']{re.escape(prop)}["\']',
-        rf'<meta[^>]+name=["\']{re.escape(prop)}["\'][^>]+content=["\']([^"\']+)["\']',
-    ]
-    for p in patterns:
-        m = re.search(p, html_text or "", re.I)
-        if m:
-            return _norm_text(m.group(1))
-    return None
+HEAD_SCAN_RE = re.compile(
+    r"<(?:title[^>]*>(?P<title>.*?)</title>"
+    r"|meta\b(?P<meta>[^>]*)>"
+    r"|script\b[^>]*ld\+json[^>]*>(?P<jsonld>.*?)</script>)",
+    re.I | re.S,
+)
+HEAD_END_RE = re.compile(r"</head>|<body\b", re.I)
+BODY_JSONLD_RE = re.compile(r"<script[^>]+ld\+json[^>]*>(.*?)</script>", re.I | re.S)
+HTML_ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
 
 
-def _extract_jsonld(html_text: str) -> list[dict]:
-    out = []
-    for m in re.finditer(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', html_text or "", re.I | re.S):
-        raw = (m.group(1) or "").strip()
-        if not raw:
-            continue
-        try:
-            data = json.loads(raw)
-            if isinstance(data, list):
-                out.extend([x for x in data if isinstance(x, dict)])
-            elif isinstance(data, dict):
-                out.append(data)
-        except Exception:
-            continue
-    return out
+def _parse_jsonld_blob(raw: str) -> list[dict]:
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    try:
+        data = json.loads(raw)
+    except Exception:
+        return []
+    if isinstance(data, list):
+        return [x for x in data if isinstance(x, dict)]
+    if isinstance(data, dict):
+        return [data]
+    return []
+
+
+def parse_html_head(html_text: str) -> dict:
+    """Recorre el documento una sola vez y junta <title>, metas y bloques JSON-LD.
+
+    El <head> se procesa con una única regex combinada; del <body> solo se sacan
+    bloques JSON-LD (búsqueda por prefijo literal, sin mirar cada tag).
+    Devuelve {"title", "meta": {property|name: content}, "jsonld": [...]} con los
+    valores en crudo; `property` gana sobre `name` y se queda la primera aparición.
+    """
+    html_text = html_text or ""
+    head = {"title": None, "meta": {}, "jsonld": []}
+    by_name: dict[str, str] = {}
+    m_end = HEAD_END_RE.search(html_text)
+    head_end = m_end.start() if m_end else len(html_text)
+    for m in HEAD_SCAN_RE.finditer(html_text, 0, head_end):
+        if m.group("title") is not None:
+            if head["title"] is None:
+                head["title"] = m.group("title")
+        elif m.group("meta") is not None:
+            attrs = {k.lower(): v1 or v2 for k, v1, v2 in HTML_ATTR_RE.findall(m.group("meta"))}
+            content = attrs.get("content")
+            if not content:
+                continue
+            if attrs.get("property"):
+                head["meta"].setdefault(attrs["property"].lower(), content)
+            elif attrs.get("name"):
+                by_name.setdefault(attrs["name"].lower(), content)
+        else:
+            head["jsonld"].extend(_parse_jsonld_blob(m.group("jsonld")))
+    for m in BODY_JSONLD_RE.finditer(html_text, head_end):
+        head["jsonld"].extend(_parse_jsonld_blob(m.group(1)))
+    for k, v in by_name.items():
+        head["meta"].setdefault(k, v)
+    return head
 
 
 def _jsonld_music_record(records: list[dict], want_type: str | None = None) -> dict | None:
@@ -716,12 +1831,73 @@ def _jsonld_music_record(records: list[dict], want_type: str | None = None) -> d
     return None
 
 
+PAGE_META_TAGS = ("og:title", "og:description", "og:image")
+JSONLD_KEEP = ("@type", "name", "byArtist", "author", "creator", "image", "inAlbum")
+# cada marcador exige la etiqueta completa (hasta ">"), para no cortar antes de content="…"
+PAGE_META_MARKERS = tuple(
+    re.compile(rf'<meta[^>]+["\']{re.escape(tag)}["\'][^>]*>', re.I) for tag in PAGE_META_TAGS
+) + (re.compile(r'application/ld\+json["\'][^>]*>[^<]*</script>', re.I),)
+
+
+def _slim_named(v):
+    return {"name": v.get("name")} if isinstance(v, dict) else v
+
+
+def _compact_jsonld(rec: dict) -> dict:
+    out = {}
+    for k in JSONLD_KEEP:
+        v = rec.get(k)
+        if v is None:
+            continue
+        if isinstance(v, list) and k != "@type":
+            v = v[:1]
+        if k in ("byArtist", "author", "creator", "inAlbum"):
+            v = [_slim_named(x) for x in v] if isinstance(v, list) else _slim_named(v)
+        out[k] = v
+    return out
+
+
+def _compact_page_meta(html_text: str) -> dict:
+    head = parse_html_head(html_text)
+    meta = {"title": _norm_text(head["title"]) if head["title"] else None}
+    for tag in PAGE_META_TAGS:
+        content = head["meta"].get(tag)
+        meta[tag] = _norm_text(content) if content else None
+    meta["jsonld"] = [_compact_jsonld(rec) for rec in head["jsonld"][:5]]
+    return meta
+
+
+async def _page_meta(url: str, kind: str) -> dict | None:
+    # Solo cacheamos <title>, og:* y JSON-LD recortado; el HTML completo se descarta.
+    cache_key = f"{kind}_meta::{normalize_music_url(url)}"
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
+        return cached
+    try:
+        status, text = await stream_fetch(normalize_music_url(url), PAGE_META_MARKERS)
+        if status == 200:
+            meta = _compact_page_meta(text)
+            ttl_set(GENERIC_CACHE, cache_key, meta, GENERIC_CACHE_TTL)
+            return meta
+    except UpstreamUnavailable as e:
+        log.debug(f"{kind} html omitido: {e}")
+        mark_skipped(f"{kind} html")
+        return None
+    except Exception as e:
+        log.debug(f"{kind} html fail: {e}")
+    ttl_set(GENERIC_CACHE, cache_key, None, 900)
+    return None
+
+
 async def _spotify_best_metadata(url: str) -> dict:
     normalized = normalize_music_url(url)
-    cached = ttl_get(SPOTIFY_CACHE, normalized)
-    if cached is not None:
+    cached = ttl_lookup(SPOTIFY_CACHE, normalized)
+    if cached is not MISS:
         return cached
+    return await single_flight(SPOTIFY_CACHE, normalized, _spotify_best_metadata_fetch, normalized)
 
+
+async def _spotify_best_metadata_fetch(normalized: str) -> dict:
     entity_type, entity_id = _extract_spotify_entity(normalized)
     data = {
         "entity_type": entity_type,
@@ -733,12 +1909,12 @@ async def _spotify_best_metadata(url: str) -> dict:
         "spotify_url": normalized,
     }
 
-    html_text = await _spotify_html(normalized)
-    if html_text:
-        title_tag = _extract_title_tag(html_text)
-        og_title = _extract_meta_content(html_text, "og:title")
-        og_desc = _extract_meta_content(html_text, "og:description")
-        og_image = _extract_meta_content(html_text, "og:image")
+    page = await _page_meta(normalized, "spotify")
+    if page:
+        title_tag = page.get("title")
+        og_title = page.get("og:title")
+        og_desc = page.get("og:description")
+        og_image = page.get("og:image")
         if og_image:
             data["cover"] = og_image
 
@@ -761,7 +1937,7 @@ async def _spotify_best_metadata(url: str) -> dict:
                 if artist_guess and not _safe_eq(artist_guess, data.get("title")):
                     data["artist"] = artist_guess
 
-        records = _extract_jsonld(html_text)
+        records = page.get("jsonld") or []
         want_map = {
             "track": "MusicRecording",
             "album": "MusicAlbum",
@@ -816,15 +1992,121 @@ async def _spotify_best_metadata(url: str) -> dict:
     return data
 
 
+# ---- Búsqueda DDG multi-sitio: una consulta con site: en OR, resultado cacheado por sitio ----
+DDG_RESULT_RE = re.compile(r'<a[^>]+class="result__a"[^>]+href="([^"]+)"')
+# sitios que se piden juntos para una canción (mismos términos de búsqueda)
+DDG_TRACK_SITES = ("youtube.com/watch", "soundcloud.com", "bandcamp.com")
+DDG_LYRICS_SITES = ("letras.com", "azlyrics.com", "genius.com")
+
+
+def _ddg_site_matches(link: str, site: str) -> bool:
+    domain, _, prefix = site.partition("/")
+    p = urlparse(link)
+    host = (p.hostname or "").lower()
+    if not (host == domain or host.endswith("." + domain)):
+        return False
+    return not prefix or p.path.startswith("/" + prefix)
+
+
+def _ddg_track_terms(artist: str | None, title: str | None) -> str:
+    return f'"{_clean_title(title or "")}" "{_clean_artist(artist or "")}"'
+
+
+async def ddg_multi_site(terms: str, sites: tuple[str, ...]) -> dict[str, str | None]:
+    """Primer resultado de cada sitio con una sola búsqueda (site:a OR site:b ...).
+
+    Cada sitio se cachea por separado, así que una petición posterior de un
+    solo sitio con los mismos términos sale de la misma respuesta. Si un
+    sitio acapara la primera página, se repite una vez solo con los que faltan.
+    """
+    out: dict[str, str | None] = {}
+    missing = []
+    for site in sites:
+        cached = ttl_lookup(GENERIC_CACHE, f"ddgs::{site}::{terms}")
+        if cached is MISS:
+            missing.append(site)
+        else:
+            out[site] = cached
+    queried = False
+    for _ in range(2):
+        if not missing:
+            break
+        batch = tuple(missing)
+        flight_key = f"ddgm::{'|'.join(batch)}::{terms}"
+        fetched = await single_flight(GENERIC_CACHE, flight_key, _ddg_multi_site_fetch, terms, batch)
+        if fetched is None:
+            # DDG con circuito abierto, sin turno o con error: sin negativos
+            mark_skipped("ddg")
+            break
+        found, saturated = fetched
+        queried = True
+        for site, link in found.items():
+            out[site] = link
+            ttl_set(GENERIC_CACHE, f"ddgs::{site}::{terms}", link, GENERIC_CACHE_TTL)
+        missing = [site for site in batch if site not in found]
+        # solo si los sitios ya encontrados llenaron la página pudo quedar fuera el resto
+        if not saturated or len(missing) == len(batch):
+            break
+    for site in missing:
+        out[site] = None
+        if queried:
+            ttl_set(GENERIC_CACHE, f"ddgs::{site}::{terms}", None, 1800)
+    return out
+
+
+async def _ddg_multi_site_fetch(terms: str, sites: tuple[str, ...]) -> tuple[dict[str, str], bool] | None:
+    """(primer resultado por sitio, página llena) o None si DDG no respondió.
+
+    "Página llena": todos los resultados eran de sitios ya encontrados, así
+    que los que faltan pueden estar más abajo y vale la pena repetir.
+    """
+    filters = " OR ".join(f"site:{site}" for site in sites)
+    query = f"{terms} ({filters})" if len(sites) > 1 else f"{terms} {filters}"
+    found: dict[str, str] = {}
+    saturated = True
+    try:
+        r = await upstream_get(DDG_HTML.format(q=quote_plus(query)), timeout=10)
+        if r.status_code != 200:
+            # 429/5xx tras los reintentos: cero resultados no es un negativo
+            log.debug(f"ddg {r.status_code} para {query}")
+            return None
+        for m in DDG_RESULT_RE.finditer(r.text or ""):
+            link = decode_ddg_redirect(m.group(1))
+            site = next((s for s in sites if _ddg_site_matches(link, s)), None)
+            if site is None:
+                saturated = False
+            elif site not in found:
+                found[site] = link
+            if len(found) == len(sites):
+                break
+    except UpstreamUnavailable as e:
+        log.debug(f"ddg omitido {query}: {e}")
+        return None
+    except Exception as e:
+        log.debug(f"ddg multi-sitio fail {query}: {e}")
+    return found, saturated
+
+
+async def ddg_site_result(terms: str, site: str, batch: tuple[str, ...]) -> str | None:
+    # los jobs de un mismo batch comparten la búsqueda vía single_flight
+    return (await ddg_multi_site(terms, batch)).get(site)
+
+
 async def _ddg_first_result(query: str, allow_hosts: tuple[str, ...]) -> str | None:
     cache_key = f"ddgq::{query}::{','.join(allow_hosts)}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
         return cached
+    return await single_flight(GENERIC_CACHE, cache_key, _ddg_first_result_fetch, query, allow_hosts, cache_key)
+
+
+async def _ddg_first_result_fetch(query: str, allow_hosts: tuple[str, ...], cache_key: str) -> str | None:
     url = DDG_HTML.format(q=quote_plus(query))
     try:
-        client = get_http_client()
-        r = await client.get(url, timeout=10)
+        r = await upstream_get(url, timeout=10)
+        if r.status_code != 200:
+            log.debug(f"ddg {r.status_code} para {query}")
+            return None
         html_text = r.text or ""
         for m in re.finditer(r'<a[^>]+class="result__a"[^>]+href="([^"]+)"', html_text):
             link = decode_ddg_redirect(m.group(1))
@@ -832,6 +2114,10 @@ async def _ddg_first_result(query: str, allow_hosts: tuple[str, ...]) -> str | N
             if any(h in host for h in allow_hosts):
                 ttl_set(GENERIC_CACHE, cache_key, link, GENERIC_CACHE_TTL)
                 return link
+    except UpstreamUnavailable as e:
+        log.debug(f"ddg omitido {query}: {e}")
+        mark_skipped("ddg")
+        return None
     except Exception as e:
         log.debug(f"ddg first result fail {query}: {e}")
     ttl_set(GENERIC_CACHE, cache_key, None, 1800)
@@ -841,12 +2127,15 @@ async def _ddg_first_result(query: str, allow_hosts: tuple[str, ...]) -> str | N
 async def apple_search_track(artist: str, title: str) -> tuple[str | None, str | None]:
     term = f"{artist} {title}".strip()
     cache_key = f"apple_search_track::{COUNTRY}::{term.lower()}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
-        return cached
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
+        return cached or (None, None)
+    return await single_flight(GENERIC_CACHE, cache_key, _apple_search_track_fetch, artist, title, term, cache_key)
+
+
+async def _apple_search_track_fetch(artist: str, title: str, term: str, cache_key: str) -> tuple[str | None, str | None]:
     try:
-        client = get_http_client()
-        r = await client.get(
+        r = await upstream_get(
             "https://itunes.apple.com/search",
             params={"term": term, "entity": "song", "limit": 5, "country": COUNTRY, "media": "music"},
             timeout=12,
@@ -863,22 +2152,28 @@ async def apple_search_track(artist: str, title: str) -> tuple[str | None, str |
                 out = (it.get("trackViewUrl"), it.get("isrc"))
                 ttl_set(GENERIC_CACHE, cache_key, out, GENERIC_CACHE_TTL)
                 return out
+    except UpstreamUnavailable as e:
+        log.debug(f"apple_search_track omitido: {e}")
+        mark_skipped("apple search")
+        return None, None
     except Exception as e:
         log.debug(f"apple_search_track fail: {e}")
-    out = (None, None)
-    ttl_set(GENERIC_CACHE, cache_key, out, 1800)
-    return out
+    ttl_set(GENERIC_CACHE, cache_key, None, 1800)
+    return None, None
 
 
 async def apple_search_album(artist: str, album: str) -> str | None:
     term = f"{artist} {album}".strip()
     cache_key = f"apple_search_album::{COUNTRY}::{term.lower()}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
         return cached
+    return await single_flight(GENERIC_CACHE, cache_key, _apple_search_album_fetch, artist, album, term, cache_key)
+
+
+async def _apple_search_album_fetch(artist: str, album: str, term: str, cache_key: str) -> str | None:
     try:
-        client = get_http_client()
-        r = await client.get(
+        r = await upstream_get(
             "https://itunes.apple.com/search",
             params={"term": term, "entity": "album", "limit": 5, "country": COUNTRY, "media": "music"},
             timeout=12,
@@ -895,6 +2190,10 @@ async def apple_search_album(artist: str, album: str) -> str | None:
                 out = it.get("collectionViewUrl")
                 ttl_set(GENERIC_CACHE, cache_key, out, GENERIC_CACHE_TTL)
                 return out
+    except UpstreamUnavailable as e:
+        log.debug(f"apple_search_album omitido: {e}")
+        mark_skipped("apple search")
+        return None
     except Exception as e:
         log.debug(f"apple_search_album fail: {e}")
     ttl_set(GENERIC_CACHE, cache_key, None, 1800)
@@ -903,12 +2202,15 @@ async def apple_search_album(artist: str, album: str) -> str | None:
 
 async def apple_search_artist(artist: str) -> str | None:
     cache_key = f"apple_search_artist::{COUNTRY}::{artist.lower()}"
-    cached = ttl_get(GENERIC_CACHE, cache_key)
-    if cached is not None:
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
         return cached
+    return await single_flight(GENERIC_CACHE, cache_key, _apple_search_artist_fetch, artist, cache_key)
+
+
+async def _apple_search_artist_fetch(artist: str, cache_key: str) -> str | None:
     try:
-        client = get_http_client()
-        r = await client.get(
+        r = await upstream_get(
             "https://itunes.apple.com/search",
             params={"term": artist, "entity": "musicArtist", "limit": 1, "country": COUNTRY, "media": "music"},
             timeout=12,
@@ -919,12 +2221,69 @@ async def apple_search_artist(artist: str) -> str | None:
                 out = results[0].get("artistLinkUrl") or results[0].get("artistViewUrl")
                 ttl_set(GENERIC_CACHE, cache_key, out, GENERIC_CACHE_TTL)
                 return out
+    except UpstreamUnavailable as e:
+        log.debug(f"apple_search_artist omitido: {e}")
+        mark_skipped("apple search")
+        return None
     except Exception as e:
         log.debug(f"apple_search_artist fail: {e}")
     ttl_set(GENERIC_CACHE, cache_key, None, 1800)
     return None
 
 
+def _title_key(title: str) -> str:
+    # clave de comparación: sin paréntesis, acentos, mayúsculas ni puntuación
+    t = _clean_title(title)
+    t = re.sub(r"\s*\([^)]*\)", "", t)
+    t = unicodedata.normalize("NFKD", t.casefold())
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return re.sub(r"[^\w]+", "", t)
+
+
+async def apple_artist_catalog(artist: str) -> dict[str, str] | None:
+    """Índice {_title_key: trackViewUrl} con el catálogo del artista en iTunes (una sola búsqueda)."""
+    artist = _clean_artist(artist or "")
+    if not artist:
+        return None
+    cache_key = f"apple_catalog::{COUNTRY}::{artist.lower()}"
+    cached = ttl_lookup(GENERIC_CACHE, cache_key)
+    if cached is not MISS:
+        return cached
+    return await single_flight(GENERIC_CACHE, cache_key, _apple_artist_catalog_fetch, artist, cache_key)
+
+
+async def _apple_artist_catalog_fetch(artist: str, cache_key: str) -> dict[str, str] | None:
+    try:
+        r = await upstream_get(
+            "https://itunes.apple.com/search",
+            params={
+                "term": artist, "entity": "song", "attribute": "artistTerm",
+                "limit": 200, "country": COUNTRY, "media": "music",
+            },
+            timeout=12,
+        )
+        if r.status_code == 200:
+            index: dict[str, str] = {}
+            for it in (r.json() or {}).get("results") or []:
+                art = _clean_artist(it.get("artistName") or "").lower()
+                if art and artist.lower() not in art and art not in artist.lower():
+                    continue
+                key = _title_key(it.get("trackName") or "")
+                # iTunes ordena por relevancia: la primera versión de cada título gana
+                if key and it.get("trackViewUrl") and key not in index:
+                    index[key] = it["trackViewUrl"]
+            ttl_set(GENERIC_CACHE, cache_key, index or None, GENERIC_CACHE_TTL)
+            return index or None
+    except UpstreamUnavailable as e:
+        log.debug(f"apple_artist_catalog omitido: {e}")
+        mark_skipped("apple catalog")
+        return None
+    except Exception as e:
+        log.debug(f"apple_artist_catalog fail: {e}")
+    ttl_set(GENERIC_CACHE, cache_key, None, 1800)
+    return None
+
+
 async def resolve_spotify_links(url: str) -> tuple[dict | None, str | None, str | None, str | None, str | None]:
     meta = await _spotify_best_metadata(url)
     entity_type = meta.get("entity_type") or "track"
@@ -944,7 +2303,8 @@ async def resolve_spotify_links(url: str) -> tuple[dict | None, str | None, str
             ytm = f"https://music.youtube.com/search?q={quote_plus(q)}"
             sc = f"https://soundcloud.com/search/people?q={quote_plus(q)}"
             bc = f"https://bandcamp.com/search?q={quote_plus(q)}&item_type=b"
-            am = await apple_search_artist(q)
+            found = await gather_within({"applemusic": apple_search_artist(q)}, SPOTIFY_RESOLVE_DEADLINE)
+            am = found.get("applemusic")
             links.update({
                 "youtube": {"url": yt},
                 "youtubemusic": {"url": ytm},
@@ -962,7 +2322,11 @@ async def resolve_spotify_links(url: str) -> tuple[dict | None, str | None, str
             links["youtubemusic"] = {"url": f"https://music.youtube.com/search?q={quote_plus(q)}"}
             links["soundcloud"] = {"url": f"https://soundcloud.com/search/albums?q={quote_plus(q)}"}
             links["bandcamp"] = {"url": f"https://bandcamp.com/search?q={quote_plus(q)}&item_type=a"}
-        am = await apple_search_album(artist or "", title or album or "")
+        found = await gather_within(
+            {"applemusic": apple_search_album(artist or "", title or album or "")},
+            SPOTIFY_RESOLVE_DEADLINE,
+        )
+        am = found.get("applemusic")
         if am:
             links["applemusic"] = {"url": _regionalize_apple(am, for_album=True)}
         return links, (title or album), artist, cover, page_url
@@ -976,41 +2340,29 @@ async def resolve_spotify_links(url: str) -> tuple[dict | None, str | None, str
             links["soundcloud"] = {"url": f"https://soundcloud.com/search/playlists?q={quote_plus(q)}"}
         return links, title, None, cover, page_url
 
-    # track default / precise best-effort
+    # track default / precise best-effort: todas las plataformas en paralelo,
+    # con plazo total; lo que no llegue queda con la URL de búsqueda.
     q = build_query(artist, title, kind="track")
-    apple_url, _ = await apple_search_track(artist or "", title or "")
+    terms = _ddg_track_terms(artist, title)
+    jobs = {"applemusic": apple_search_track(artist or "", title or "")}
+    if q:
+        # una sola búsqueda DDG para los tres sitios
+        jobs["youtube"] = ddg_site_result(terms, "youtube.com/watch", DDG_TRACK_SITES)
+        jobs["soundcloud"] = ddg_site_result(terms, "soundcloud.com", DDG_TRACK_SITES)
+        jobs["bandcamp"] = ddg_site_result(terms, "bandcamp.com", DDG_TRACK_SITES)
+    found = await gather_within(jobs, SPOTIFY_RESOLVE_DEADLINE)
+
+    apple_url, _ = found.get("applemusic") or (None, None)
     if apple_url:
         links["applemusic"] = {"url": _regionalize_apple(apple_url)}
 
-    direct_yt = None
     if q:
-        direct_yt = await _ddg_first_result(
-            f'site:youtube.com/watch "{_clean_title(title or "")}" "{_clean_artist(artist or "")}"',
-            ("youtube.com",),
-        )
-        if direct_yt:
-            links["youtube"] = {"url": direct_yt}
-        else:
-            links["youtube"] = {"url": f"https://www.youtube.com/results?search_query={quote_plus(q)}"}
-
+        links["youtube"] = {"url": found.get("youtube") or f"https://www.youtube.com/results?search_query={quote_plus(q)}"}
         # YT Music usually lacks good public HTML results; use focused search URL
         links["youtubemusic"] = {"url": f"https://music.youtube.com/search?q={quote_plus(q)}"}
-
-        direct_sc = await _ddg_first_result(
-            f'site:soundcloud.com/ "{_clean_title(title or "")}" "{_clean_artist(artist or "")}"',
-            ("soundcloud.com",),
-        )
-        if direct_sc:
-            links["soundcloud"] = {"url": direct_sc}
-        else:
-            links["soundcloud"] = {"url": f"https://soundcloud.com/search?q={quote_plus(q)}"}
-
-        direct_bc = await _ddg_first_result(
-            f'site:bandcamp.com "{_clean_title(title or "")}" "{_clean_artist(artist or "")}"',
-            ("bandcamp.com",),
-        )
-        if direct_bc:
-            links["bandcamp"] = {"url": direct_bc}
+        links["soundcloud"] = {"url": found.get("soundcloud") or f"https://soundcloud.com/search?q={quote_plus(q)}"}
+        if found.get("bandcamp"):
+            links["bandcamp"] = {"url": found["bandcamp"]}
 
     return links, title, artist, cover, page_url
 
@@ -1110,11 +2462,17 @@ def _album_from_yt_like(url: str, prefer_music: bool):
     return None, None
 
 
+YT_ALBUM_MARKERS = (re.compile(r'"playlistId":"OLAK'), re.compile(r'list=OLAK'))
+
+
 async def _ytm_album_from_page(url: str, prefer_music: bool = True):
+    if not budget_allows():
+        mark_skipped("youtube album")
+        return None, None
     try:
-        client = get_http_client()
-        r = await client.get(url, timeout=12)
-        html_text = r.text or ""
+        _, html_text = await stream_fetch(
+            url, YT_ALBUM_MARKERS, need_all=False, max_bytes=YT_STREAM_MAX_BYTES, timeout=12,
+        )
         m = re.search(r'"playlistId":"(OLAK[^"]+)"', html_text) or re.search(r'list=(OLAK[^"&]+)', html_text)
         if m:
             pid = m.group(1)
@@ -1146,28 +2504,38 @@ async def _album_from_soundcloud(url: str):
     return None, None
 
 
+async def _album_for_platform(key: str, plat_url: str) -> str | None:
+    if key == "applemusic":
+        album_url, _ = _album_from_apple(plat_url)
+    elif key == "spotify":
+        album_url, _ = await _album_from_spotify(plat_url)
+    elif key == "youtubemusic":
+        album_url, _ = await _album_from_youtube_robust(plat_url, True)
+    elif key == "youtube":
+        album_url, _ = await _album_from_youtube_robust(plat_url, False)
+    elif key == "soundcloud":
+        album_url, _ = await _album_from_soundcloud(plat_url)
+    else:
+        album_url = None
+    return album_url
+
+
 async def derive_album_buttons_all(links: dict):
+    keys = [
+        k for k in ["applemusic", "spotify", "youtubemusic", "youtube", "soundcloud"]
+        if k in links and links[k].get("url")
+    ]
+    # Las plataformas son independientes: se consultan en paralelo y se
+    # mezclan en el orden fijo de arriba.
+    results = await asyncio.gather(
+        *[_album_for_platform(k, links[k]["url"]) for k in keys],
+        return_exceptions=True,
+    )
     buttons, seen = [], set()
-    for key in ["applemusic", "spotify", "youtubemusic", "youtube", "soundcloud"]:
-        if key not in links:
+    for key, album_url in zip(keys, results):
+        if isinstance(album_url, BaseException):
+            log.debug(f"album {key} fail: {album_url}")
             continue
-        plat_url = links[key].get("url")
-        if not plat_url:
-            continue
-
-        if key == "applemusic":
-            album_url, _ = _album_from_apple(plat_url)
-        elif key == "spotify":
-            album_url, _ = await _album_from_spotify(plat_url)
-        elif key == "youtubemusic":
-            album_url, _ = await _album_from_youtube_robust(plat_url, True)
-        elif key == "youtube":
-            album_url, _ = await _album_from_youtube_robust(plat_url, False)
-        elif key == "soundcloud":
-            album_url, _ = await _album_from_soundcloud(plat_url)
-        else:
-            album_url = None
-
         if album_url and album_url not in seen:
             seen.add(album_url)
             buttons.append((ALBUM_LABEL.get(key, "💿"), album_url))
@@ -1214,8 +2582,7 @@ async def _musixmatch_share_url(artist: str, title: str) -> str | None:
     if not q_title:
         return None
     try:
-        client = get_http_client()
-        r = await client.get(
+        r = await upstream_get(
             "https://api.musixmatch.com/ws/1.1/track.search",
             params={
                 "q_track": q_title,
@@ -1233,6 +2600,10 @@ async def _musixmatch_share_url(artist: str, title: str) -> str | None:
             return None
         track = track_list[0].get("track") or {}
         return track.get("track_share_url") or None
+    except UpstreamUnavailable as e:
+        log.debug(f"musixmatch omitido: {e}")
+        mark_skipped("musixmatch")
+        return None
     except Exception:
         return None
 
@@ -1252,26 +2623,26 @@ async def _lyricscom_link(artist: str, title: str) -> str | None:
             "format": "json",
         }
         try:
-            client = get_http_client()
-            r = await client.get(base, params=params, timeout=10)
+            r = await upstream_get(base, params=params, timeout=10)
             j = r.json() or {}
             results = j.get("result") or []
             if isinstance(results, list) and results:
                 link = (results[0] or {}).get("song-link")
                 if link:
                     return link
+        except UpstreamUnavailable as e:
+            log.debug(f"stands4 omitido: {e}")
+            mark_skipped("stands4")
         except Exception:
             pass
     return None
 
 
 async def _ddg_first_result_site(site: str, artist: str, title: str) -> str | None:
-    q_title = _clean_title(title or "")
-    q_artist = _clean_artist(artist or "")
-    if not q_title:
+    if not _clean_title(title or ""):
         return None
-    query = f'site:{site} "{q_title}" "{q_artist}" lyrics'
-    return await _ddg_first_result(query, (site.replace("www.", ""),))
+    # letras, azlyrics y genius salen de la misma búsqueda
+    return await ddg_site_result(f"{_ddg_track_terms(artist, title)} lyrics", site, DDG_LYRICS_SITES)
 
 
 async def get_lyrics_links(artist: str | None, title: str | None) -> dict | None:
@@ -1281,19 +2652,27 @@ async def get_lyrics_links(artist: str | None, title: str | None) -> dict | None
         return None
 
     cache_key = f"lyrics::{_clean_artist(artist)}::{_clean_title(title)}"
-    cached = ttl_get(LYRICS_CACHE, cache_key)
-    if cached is not None:
+    cached = ttl_lookup(LYRICS_CACHE, cache_key)
+    if cached is not MISS:
         return cached
+    if not budget_allows():
+        log.info(f"Sin presupuesto para letras: {cache_key}")
+        mark_skipped("lyrics")
+        return None
+    return await single_flight(LYRICS_CACHE, cache_key, _lyrics_links_fetch, artist, title, cache_key)
 
-    mm, lc = await asyncio.gather(
-        _musixmatch_share_url(artist, title),
-        _lyricscom_link(artist, title),
-    )
-    letras, az, genius = await asyncio.gather(
-        _ddg_first_result_site("www.letras.com", artist, title),
-        _ddg_first_result_site("www.azlyrics.com", artist, title),
-        _ddg_first_result_site("genius.com", artist, title),
-    )
+
+async def _lyrics_links_fetch(artist: str, title: str, cache_key: str) -> dict | None:
+    with track_skips() as skipped:
+        mm, lc = await asyncio.gather(
+            _musixmatch_share_url(artist, title),
+            _lyricscom_link(artist, title),
+        )
+        letras, az, genius = await asyncio.gather(
+            _ddg_first_result_site("letras.com", artist, title),
+            _ddg_first_result_site("azlyrics.com", artist, title),
+            _ddg_first_result_site("genius.com", artist, title),
+        )
 
     result = None
     if any([mm, lc, letras, az, genius]):
@@ -1304,7 +2683,15 @@ async def get_lyrics_links(artist: str | None, title: str | None) -> dict | None
             "azlyrics": az,
             "genius": genius,
         }
-    ttl_set(LYRICS_CACHE, cache_key, result, LYRICS_CACHE_TTL)
+    # proveedor saltado (sin turno o circuito abierto) o host aún inestable: resultado incompleto, TTL corto
+    degraded = bool(skipped) or any(HOST_POLICIES[n].state != "closed" for n in ("ddg", "musixmatch", "stands4"))
+    if skipped:
+        log.info(f"Letras incompletas ({', '.join(sorted(set(skipped)))}): {cache_key}")
+    if result is None:
+        # sin ninguna letra suele ser un fallo pasajero: negativo corto, como los demás resolvers
+        ttl_set(LYRICS_CACHE, cache_key, None, 300 if degraded else 1800)
+    else:
+        ttl_set(LYRICS_CACHE, cache_key, result, 300 if degraded else LYRICS_CACHE_TTL)
     return result
 
 
@@ -1370,63 +2757,91 @@ def build_keyboard(
 
 
 # ===== Odesli (optional for non-Spotify) =====
+ODESLI_API = "https://api.song.link/v1-alpha.1/links"
+ODESLI_LIMITER = AdaptiveLimiter(
+    "odesli", ODESLI_RATE_PER_MIN / 60, ODESLI_BURST, ODESLI_MAX_CONCURRENCY, ODESLI_MAX_QUEUE_WAIT,
+)
+
+
 async def fetch_odesli(url: str):
-    api = "https://api.song.link/v1-alpha.1/links"
     normalized_url = normalize_music_url(url)
 
-    cached = ttl_get(ODESLI_CACHE, normalized_url)
-    if cached is not None:
+    cached = ttl_lookup(ODESLI_CACHE, normalized_url)
+    if cached is not MISS:
         log.info(f"Odesli cache HIT: {normalized_url}")
-        return cached
+        return cached or (None, None, None, None, None)
+    return await single_flight(ODESLI_CACHE, normalized_url, _odesli_fetch, normalized_url)
 
+
+async def _odesli_fetch(normalized_url: str):
     params = {"url": normalized_url, "userCountry": COUNTRY}
     headers = {"Accept-Language": f"es-{COUNTRY},es;q=0.9,en;q=0.8"}
 
-    async with ODESLI_SEM:
-        client = get_http_client()
-
-        for attempt in range(ODESLI_MAX_RETRIES):
-            try:
-                r = await client.get(api, params=params, headers=headers, timeout=12)
-
-                if r.status_code == 200:
-                    data = r.json()
-                    raw_links = (data.get("linksByPlatform", {}) or {})
-                    links_norm = normalize_links(raw_links)
-                    links_for_track = regionalize_links_for_track(links_norm)
-                    uid = data.get("entityUniqueId")
-                    entity = data.get("entitiesByUniqueId", {}).get(uid, {}) if uid else {}
-                    title = entity.get("title")
-                    artist = entity.get("artistName")
-                    thumb = entity.get("thumbnailUrl")
-                    page_url = data.get("pageUrl") or data.get("pageUrlShort") or data.get("url")
-                    result = (links_for_track or None, title, artist, thumb, page_url)
-                    ttl_set(ODESLI_CACHE, normalized_url, result, ODESLI_CACHE_TTL)
-                    log.info(f"Odesli OK: {normalized_url}")
-                    return result
-
-                if r.status_code == 429:
-                    wait_s = min(2 * (attempt + 1), 6)
-                    log.warning(
-                        f"Odesli 429 para {normalized_url}. "
-                        f"Reintento {attempt + 1}/{ODESLI_MAX_RETRIES} en {wait_s}s"
-                    )
-                    await asyncio.sleep(wait_s)
-                    continue
+    client = get_http_client()
 
-                log.warning(f"Odesli devolvió {r.status_code} para {normalized_url}")
-                ttl_set(ODESLI_CACHE, normalized_url, (None, None, None, None, None), 300)
-                return None, None, None, None, None
+    outcome = "error"
+    for attempt in range(ODESLI_MAX_RETRIES):
+        left = time_left()
+        max_wait = None if left is None else left - UPSTREAM_MIN_TIMEOUT
+        if not await ODESLI_LIMITER.acquire(max_wait):
+            # Odesli saturado: sin cachear negativo, el llamador sigue con los fallbacks
+            log.warning(f"Odesli saturado, sin turno para {normalized_url}")
+            mark_skipped("odesli")
+            return None, None, None, None, None
 
-            except Exception as e:
-                wait_s = min(1 + attempt, 4)
+        outcome = "error"
+        wait_s = 0.0
+        try:
+            r = await client.get(ODESLI_API, params=params, headers=headers, timeout=http_timeout(12))
+
+            if r.status_code == 200:
+                outcome = "ok"
+                data = r.json()
+                raw_links = (data.get("linksByPlatform", {}) or {})
+                links_norm = normalize_links(raw_links)
+                links_for_track = regionalize_links_for_track(links_norm)
+                uid = data.get("entityUniqueId")
+                entity = data.get("entitiesByUniqueId", {}).get(uid, {}) if uid else {}
+                title = entity.get("title")
+                artist = entity.get("artistName")
+                thumb = entity.get("thumbnailUrl")
+                page_url = data.get("pageUrl") or data.get("pageUrlShort") or data.get("url")
+                result = (links_for_track or None, title, artist, thumb, page_url)
+                ttl_set(ODESLI_CACHE, normalized_url, result, ODESLI_CACHE_TTL)
+                log.info(f"Odesli OK: {normalized_url}")
+                return result
+
+            if r.status_code == 429:
+                outcome = "throttled"
+                # el bloqueo lo aplica el limitador; no se retiene el turno mientras tanto
+                ODESLI_LIMITER.penalize(_retry_after_seconds(r) or min(2 * (attempt + 1), 6))
                 log.warning(
-                    f"Odesli error intento {attempt + 1}/{ODESLI_MAX_RETRIES} "
-                    f"para {normalized_url}: {e}"
+                    f"Odesli 429 para {normalized_url}. "
+                    f"Reintento {attempt + 1}/{ODESLI_MAX_RETRIES}; límite {ODESLI_LIMITER.limit:.1f}"
                 )
-                await asyncio.sleep(wait_s)
+                continue
 
-    ttl_set(ODESLI_CACHE, normalized_url, (None, None, None, None, None), 300)
+            outcome = "ok"
+            log.warning(f"Odesli devolvió {r.status_code} para {normalized_url}")
+            ttl_set(ODESLI_CACHE, normalized_url, None, 300)
+            return None, None, None, None, None
+
+        except Exception as e:
+            wait_s = min(1 + attempt, 4)
+            log.warning(
+                f"Odesli error intento {attempt + 1}/{ODESLI_MAX_RETRIES} "
+                f"para {normalized_url}: {e}"
+            )
+        finally:
+            await ODESLI_LIMITER.release(outcome)
+
+        if not budget_allows(wait_s + UPSTREAM_MIN_TIMEOUT):
+            break
+        await asyncio.sleep(wait_s)
+
+    if outcome != "throttled":
+        # un 429 habla de la cuota, no del enlace: no se cachea como negativo
+        ttl_set(ODESLI_CACHE, normalized_url, None, 300)
     return None, None, None, None, None
 
 
@@ -1445,13 +2860,17 @@ def _extract_setlist_id_from_path(path: str) -> str | None:
     return m.group(1).lower() if m else None
 
 
+SETLIST_ID_MARKERS = (
+    re.compile(r'property=["\']og:url["\'][^>]+content=["\'][^"\']+["\']', re.I),
+    re.compile(r'/setlist/[^"\']*?-[0-9a-z]{6,12}\.html', re.I),
+)
+
+
 async def _extract_setlist_id_from_html(url: str) -> str | None:
     try:
-        client = get_http_client()
-        r = await client.get(url, timeout=12)
-        if r.status_code != 200:
+        status, html_text = await stream_fetch(url, SETLIST_ID_MARKERS, need_all=False, timeout=12)
+        if status != 200:
             return None
-        html_text = r.text or ""
         m = re.search(r'property=["\']og:url["\'][^>]+content=["\']([^"\']+)["\']', html_text, re.I)
         if m:
             canon = m.group(1)
@@ -1481,8 +2900,8 @@ async def fetch_setlist_json(setlist_id: str) -> dict | None:
         return None
 
     cache_key = f"setlist_json::{setlist_id}"
-    cached = ttl_get(SETLIST_CACHE, cache_key)
-    if cached is not None:
+    cached = ttl_lookup(SETLIST_CACHE, cache_key)
+    if cached is not MISS:
         return cached
 
     url = f"https://api.setlist.fm/rest/1.0/setlist/{setlist_id}"
@@ -1493,13 +2912,14 @@ async def fetch_setlist_json(setlist_id: str) -> dict | None:
         "User-Agent": "setlist-resolver-bot/1.1",
     }
     try:
-        client = get_http_client()
-        r = await client.get(url, headers=headers, timeout=15)
+        r = await upstream_get(url, headers=headers, timeout=15)
         if r.status_code == 200:
             data = r.json()
             ttl_set(SETLIST_CACHE, cache_key, data, SETLIST_CACHE_TTL)
             return data
         log.warning(f"setlist.fm {setlist_id} -> {r.status_code}: {r.text[:300]}")
+        if r.status_code == 404:
+            ttl_set(SETLIST_CACHE, cache_key, None, 1800)
     except Exception as e:
         log.warning(f"Error consultando setlist.fm: {e}")
     return None
@@ -1548,8 +2968,61 @@ def parse_setlist_songs(js: dict) -> tuple[dict, list[dict]]:
     return meta, songs
 
 
-async def resolve_song_links(artist: str, title: str) -> tuple[dict | None, str | None]:
-    apple_url, _ = await apple_search_track(artist, title)
+SONG_INDEX_PLATFORMS = ("spotify", "applemusic", "youtube", "youtubemusic")
+TRACK_URL_RE = re.compile(
+    r"spotify\.com/(?:intl-[a-z]+/)?track/|music\.apple\.com/.*(?:[?&]i=|/song/)"
+    r"|deezer\.com/(?:[a-z]{2}/)?track/|tidal\.com/(?:browse/)?track/|music\.youtube\.com/watch",
+    re.I,
+)
+
+
+def _song_index_key(artist: str, title: str) -> str | None:
+    a, t = _title_key(_clean_artist(artist or "")), _title_key(title or "")
+    return f"{a}::{t}" if a and t else None
+
+
+def lookup_song(artist: str, title: str) -> tuple[dict, str | None] | None:
+    key = _song_index_key(artist, title)
+    hit = ttl_get(SONG_INDEX, key) if key else None
+    return (hit["links"], hit.get("page_url")) if hit else None
+
+
+def remember_song(artist: str | None, title: str | None, links: dict | None, page_url: str | None,
+                  overwrite: bool = True):
+    key = _song_index_key(artist, title)
+    links = {k: {"url": v["url"]} for k, v in (links or {}).items() if k in SONG_INDEX_PLATFORMS and v.get("url")}
+    if not key or not links:
+        return
+    if not overwrite and ttl_get(SONG_INDEX, key):
+        return
+    ttl_set(SONG_INDEX, key, {"links": links, "page_url": page_url}, SONG_INDEX_TTL)
+
+
+def index_single_track(url: str, links: dict | None, title: str | None, artist: str | None,
+                       page_url: str | None, skipped: list[str]):
+    """Alimenta el índice con un enlace suelto de canción resuelto por completo.
+
+    Con búsquedas saltadas o fuera de plazo los links son más pobres de lo
+    normal: no se guardan, para no dejar un mes una entrada a medias.
+    """
+    if not TRACK_URL_RE.search(url):
+        return
+    if skipped:
+        log.info(f"Índice de canciones: no guardo {url} (saltado: {', '.join(sorted(set(skipped)))})")
+        return
+    remember_song(artist, title, links, page_url)
+
+
+async def resolve_song_links(
+    artist: str, title: str, catalog: dict[str, str] | None = None,
+) -> tuple[dict | None, str | None]:
+    hit = lookup_song(artist, title)
+    if hit:
+        return hit
+    # luego el catálogo del artista (ya descargado); búsqueda por canción solo si no está
+    apple_url = (catalog or {}).get(_title_key(title))
+    if not apple_url:
+        apple_url, _ = await apple_search_track(artist, title)
     if not apple_url:
         return None, None
     links = {
@@ -1557,6 +3030,8 @@ async def resolve_song_links(artist: str, title: str) -> tuple[dict | None, str
         "youtube": {"url": f"https://www.youtube.com/results?search_query={quote_plus(build_query(artist, title))}"},
         "youtubemusic": {"url": f"https://music.youtube.com/search?q={quote_plus(build_query(artist, title))}"},
     }
+    # no pisa una entrada más rica (p. ej. con Spotify) que venga de un enlace suelto
+    remember_song(artist, title, links, apple_url, overwrite=False)
     return links, apple_url
 
 
@@ -1574,7 +3049,8 @@ SETLIST_ORDER = deque(maxlen=120)
 
 def remember_setlist(setlist_id: str, meta: dict, items: list[dict]) -> str:
     key = uuid.uuid4().hex
-    SETLIST_STORE[key] = {"setlist_id": setlist_id, "meta": meta, "items": items}
+    # "pages": {página: task} de resolución; los items se completan in situ al resolverse
+    SETLIST_STORE[key] = {"setlist_id": setlist_id, "meta": meta, "items": items, "pages": {}}
     SETLIST_ORDER.append(key)
     while len(SETLIST_STORE) > SETLIST_ORDER.maxlen:
         old = SETLIST_ORDER.popleft()
@@ -1582,6 +3058,65 @@ def remember_setlist(setlist_id: str, meta: dict, items: list[dict]) -> str:
     return key
 
 
+def _setlist_page_range(total: int, page: int) -> tuple[int, int, int]:
+    pages = max(1, (total + SETLIST_PAGE_SIZE - 1) // SETLIST_PAGE_SIZE)
+    page = max(0, min(page, pages - 1))
+    start = page * SETLIST_PAGE_SIZE
+    return page, start, min(total, start + SETLIST_PAGE_SIZE)
+
+
+@with_budget(SETLIST_BUDGET)
+async def _resolve_setlist_items(entry: dict, start: int, end: int):
+    artist = (entry["meta"] or {}).get("artist") or ""
+    chunk = [it for it in entry["items"][start:end] if "links" not in it]
+    indexed = [lookup_song(artist, it.get("title") or "") is not None for it in chunk]
+    # con toda la página ya en el índice (misma gira) no hace falta ni el catálogo
+    catalog = await apple_artist_catalog(artist) if not all(indexed) else None
+    sem = asyncio.Semaphore(SETLIST_MAX_CONCURRENCY)
+
+    async def _resolve_one(it: dict):
+        # un fallo deja esa canción con "⋯ Buscar", sin afectar al resto
+        try:
+            async with sem:
+                links, page_url = await resolve_song_links(artist, it.get("title") or "", catalog)
+        except Exception as e:
+            log.warning(f"setlist: no pude resolver {it.get('title')!r}: {e}")
+            links, page_url = None, None
+        it["links"] = links or {}
+        it["page_url"] = page_url
+
+    local = sum(
+        1 for it, hit in zip(chunk, indexed)
+        if not hit and _title_key(it.get("title") or "") in (catalog or {})
+    )
+    await asyncio.gather(*(_resolve_one(it) for it in chunk))
+    log.info(
+        f"setlist {entry['setlist_id']} canciones {start + 1}-{end}: {sum(indexed)} del índice, "
+        f"{local} del catálogo de {artist}, {len(chunk) - sum(indexed) - local} buscadas"
+    )
+
+
+async def ensure_setlist_page(key: str, page: int) -> bool:
+    """Resuelve las canciones de una página una sola vez; prefetch y callback comparten el task."""
+    entry = SETLIST_STORE.get(key)
+    if not entry:
+        return False
+    page, start, end = _setlist_page_range(len(entry["items"]), page)
+    task = entry["pages"].get(page)
+    if task is None:
+        task = asyncio.ensure_future(_resolve_setlist_items(entry, start, end))
+        entry["pages"][page] = task
+    await asyncio.shield(task)
+    return True
+
+
+def prefetch_setlist_page(key: str, page: int):
+    entry = SETLIST_STORE.get(key)
+    if not entry or page * SETLIST_PAGE_SIZE >= len(entry["items"]) or page in entry["pages"]:
+        return
+    spawn(ensure_setlist_page(key, page))
+
+
 def _format_song_label(idx: int, title: str, cover: str | None) -> str:
     base = f"{idx}. {title}"
     return f"{base} (cover de {cover})" if cover else base
@@ -1595,9 +3130,8 @@ def build_setlist_keyboard(key: str, page: int) -> InlineKeyboardMarkup:
     items = entry["items"]
     total = len(items)
     pages = max(1, (total + SETLIST_PAGE_SIZE - 1) // SETLIST_PAGE_SIZE)
-    page = max(0, min(page, pages - 1))
-    start = page * SETLIST_PAGE_SIZE
-    chunk = items[start:start + SETLIST_PAGE_SIZE]
+    page, start, end = _setlist_page_range(total, page)
+    chunk = items[start:end]
 
     botones: list[list[InlineKeyboardButton]] = []
     url = (entry.get("meta") or {}).get("url")
@@ -1606,6 +3140,10 @@ def build_setlist_keyboard(key: str, page: int) -> InlineKeyboardMarkup:
 
     for i, it in enumerate(chunk, start=start + 1):
         title = _format_song_label(i, it.get("title") or "", it.get("cover"))
+        if "links" not in it:
+            # aún resolviéndose: solo el título, los botones llegan en la siguiente edición
+            botones.append([InlineKeyboardButton(f"⏳ {title}"[:64], callback_data=f"noop|{key}")])
+            continue
         botones.append([InlineKeyboardButton(title[:64], callback_data=f"noop|{key}")])
 
         links = it.get("links") or {}
@@ -1643,6 +3181,7 @@ def build_setlist_keyboard(key: str, page: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(botones)
 
 
+@with_budget(SETLIST_BUDGET)
 async def handle_setlist(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
     setlist_id = _extract_setlist_id(url)
     if not setlist_id:
@@ -1668,22 +3207,8 @@ async def handle_setlist(update: Update, context: ContextTypes.DEFAULT_TYPE, url
         cached = {"meta": meta, "songs_raw": songs_raw}
         ttl_set(SETLIST_CACHE, f"setlist_bundle::{setlist_id}", cached, SETLIST_CACHE_TTL)
 
-    artist_show = (cached["meta"] or {}).get("artist") or ""
-    songs_raw = cached["songs_raw"]
-    sem = asyncio.Semaphore(SETLIST_MAX_CONCURRENCY)
-    resolved: list[dict] = []
-
-    await update.message.reply_text("Procesando setlist…")
-
-    async def _resolve_one(s):
-        title = s.get("title") or ""
-        cover = s.get("cover")
-        async with sem:
-            links, page_url = await resolve_song_links(artist_show, title)
-        resolved.append({"title": title, "cover": cover, "links": links or {}, "page_url": page_url})
-
-    await asyncio.gather(*[_resolve_one(s) for s in songs_raw])
-    key = remember_setlist(setlist_id, cached["meta"], resolved)
+    items = [{"title": s.get("title") or "", "cover": s.get("cover")} for s in cached["songs_raw"]]
+    key = remember_setlist(setlist_id, cached["meta"], items)
 
     meta = cached["meta"] or {}
     cap_parts = []
@@ -1696,80 +3221,276 @@ async def handle_setlist(update: Update, context: ContextTypes.DEFAULT_TYPE, url
         cap_parts.append(meta["eventDate"])
     header = " | ".join(cap_parts) if cap_parts else "Setlist"
 
-    caption = f"{header}\n📃 {len(resolved)} canciones\n\nSelecciona una canción y elige plataforma:"
+    status = await update.message.reply_text("Procesando setlist…")
+    # solo la primera página antes de responder; el resto se resuelve al paginar.
+    # Mientras tanto se edita el mensaje de progreso con lo ya resuelto, en orden.
+    _, _, end = _setlist_page_range(len(items), 0)
+    page_task = asyncio.ensure_future(ensure_setlist_page(key, 0))
+    shown = -1
+    while not page_task.done():
+        await asyncio.wait({page_task}, timeout=SETLIST_PROGRESS_INTERVAL)
+        done = sum(1 for it in items[:end] if "links" in it)
+        if page_task.done() or done == shown:
+            continue
+        shown = done
+        try:
+            await status.edit_text(
+                f"{header}\n⏳ Procesando setlist… {done}/{end}",
+                reply_markup=build_setlist_keyboard(key, page=0),
+            )
+        except Exception as e:
+            log.debug(f"No pude editar progreso (setlist): {e}")
+    await page_task
+
+    caption = f"{header}\n📃 {len(items)} canciones\n\nSelecciona una canción y elige plataforma:"
     keyboard = build_setlist_keyboard(key, page=0)
-    await update.message.reply_text(caption, reply_markup=keyboard)
+    try:
+        await status.edit_text(caption, reply_markup=keyboard)
+    except Exception as e:
+        log.warning(f"No pude editar mensaje de setlist, envío uno nuevo: {e}")
+        await update.message.reply_text(caption, reply_markup=keyboard)
+    prefetch_setlist_page(key, 1)
 
 
 # -------- Chat handler --------
+def links_caption(title: str | None, artist_name: str | None) -> str:
+    if title and artist_name:
+        return f"🎵 {title} — {artist_name}\n🎶 Disponible en:"
+    if title:
+        return f"🎵 {title}\n🎶 Disponible en:"
+    return "🎶 Disponible en:"
+
+
+async def resolve_music_core(url: str) -> dict:
+    """Primera etapa: artista o links de plataformas (lo mínimo para responder)."""
+    artist = await detect_artist(url)
+    if artist:
+        return {"artist": artist["name"]}
+
+    with track_skips() as skipped:
+        links, title, artist_name, cover, page_url = await resolve_generic_music_url(url)
+    if not links:
+        return {"links": None}
+    index_single_track(url, links, title, artist_name, page_url, skipped)
+    return {
+        "links": links,
+        "album_buttons": [],
+        "lyrics_links": None,
+        "title": title,
+        "artist_name": artist_name,
+        "cover": cover,
+        "page_url": page_url,
+    }
+
+
+def start_music_extras(reply: dict) -> tuple[asyncio.Task, asyncio.Task]:
+    # Letras y álbumes solo dependen de los links: se lanzan en paralelo.
+    lyrics_task = asyncio.ensure_future(get_lyrics_links(reply["artist_name"] or "", reply["title"] or ""))
+    albums_task = asyncio.ensure_future(derive_album_buttons_all(reply["links"]))
+    return lyrics_task, albums_task
+
+
+async def resolve_music_reply(url: str, progressive: bool = False) -> dict:
+    """Resuelve todo lo necesario para responder a un enlace musical.
+
+    Con progressive=True no espera letras/álbumes: deja sus tasks en
+    reply["extras"] para editarlos en el teclado cuando terminen.
+    """
+    reply = await resolve_music_core(url)
+    if not reply.get("links"):
+        return reply
+    extras = start_music_extras(reply)
+    if progressive:
+        reply["extras"] = extras
+    else:
+        reply["lyrics_links"], reply["album_buttons"] = await asyncio.gather(*extras)
+    return reply
+
+
+async def _send_music_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, reply: dict):
+    if reply.get("artist"):
+        name = reply["artist"]
+        caption = f"🧑‍🎤 {name}\n🔎 Búscalo en:"
+        kb = build_artist_search_keyboard(name)
+        await update.message.reply_text(caption, reply_markup=kb)
+        return
+
+    links = reply.get("links")
+    if not links:
+        await update.message.reply_text("No pude resolver ese enlace ahora. Intenta de nuevo en un momento.")
+        return
+
+    key = remember_links(
+        links=links,
+        album_buttons=reply["album_buttons"],
+        lyrics_links=reply["lyrics_links"],
+        title=reply["title"],
+        artist_name=reply["artist_name"],
+        cover=reply["cover"],
+        page_url=reply["page_url"],
+    )
+    keyboard = build_keyboard(
+        links,
+        show_all=False,
+        key=key,
+        album_buttons=reply["album_buttons"],
+        lyrics_links=reply["lyrics_links"],
+    )
+    caption = links_caption(reply["title"], reply["artist_name"])
+
+    msg = None
+    cover = reply["cover"]
+    if cover:
+        try:
+            msg = await context.bot.send_photo(
+                chat_id=update.effective_chat.id,
+                photo=cover,
+                caption=caption,
+                reply_markup=keyboard,
+            )
+        except Exception as e:
+            log.info(f"No pude usar la portada, envío texto. {e}")
+
+    if msg is None:
+        msg = await update.message.reply_text(caption, reply_markup=keyboard)
+
+    if reply.get("extras"):
+        spawn(_edit_in_extras(context, msg, key, reply["extras"]))
+
+
+def _task_result(task: asyncio.Task, default=None):
+    if not task.done() or task.cancelled() or task.exception() is not None:
+        return default
+    return task.result()
+
+
+async def _edit_in_extras(context: ContextTypes.DEFAULT_TYPE, msg, key: str, extras: tuple[asyncio.Task, asyncio.Task]):
+    """Agrega letras y álbumes al teclado ya enviado con una o dos ediciones.
+
+    Cuando termina la primera etapa se espera una ventana corta por la otra,
+    para juntar ambas en una sola edición si llegan cerca.
+    """
+    lyrics_task, albums_task = extras
+    _, pending = await asyncio.wait(extras, return_when=asyncio.FIRST_COMPLETED)
+    if pending:
+        _, pending = await asyncio.wait(pending, timeout=PROGRESSIVE_COALESCE_WINDOW)
+    await _refresh_links_markup(context, msg, key, lyrics_task, albums_task)
+    if pending:
+        await asyncio.wait(pending)
+        await _refresh_links_markup(context, msg, key, lyrics_task, albums_task)
+
+
+async def _refresh_links_markup(context: ContextTypes.DEFAULT_TYPE, msg, key: str, lyrics_task, albums_task):
+    entry = STORE.get(key)
+    if not entry:
+        return
+    lyrics_links = _task_result(lyrics_task, entry.get("lyrics_links"))
+    album_buttons = _task_result(albums_task, entry.get("albums")) or []
+    if lyrics_links == entry.get("lyrics_links") and album_buttons == entry.get("albums"):
+        return
+    entry["lyrics_links"] = lyrics_links
+    entry["albums"] = album_buttons
+    keyboard = build_keyboard(
+        entry["links"],
+        show_all=entry.get("show_all", False),
+        key=key,
+        album_buttons=album_buttons,
+        lyrics_links=lyrics_links,
+    )
+    try:
+        await context.bot.edit_message_reply_markup(
+            chat_id=msg.chat_id,
+            message_id=msg.message_id,
+            reply_markup=keyboard,
+        )
+    except Exception as e:
+        log.warning(f"No pude agregar letras/álbumes al teclado: {e}")
+
+
+async def _safe_music_reply(url: str) -> dict:
+    try:
+        return await resolve_music_reply(url, progressive=PROGRESSIVE_REPLIES)
+    except Exception as e:
+        log.warning(f"Fallo resolviendo {url}: {e}")
+        return {"links": None}
+
+
+@with_budget(MESSAGE_BUDGET)
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text if update.message else ""
     urls = find_urls(text)
     if not urls:
         return
 
-    for url in urls:
-        if is_setlist_url(url):
-            await handle_setlist(update, context, url)
-            continue
-
-        if is_music_url(url):
-            artist = await detect_artist(url)
-            if artist:
-                name = artist["name"]
-                caption = f"🧑‍🎤 {name}\n🔎 Búscalo en:"
-                kb = build_artist_search_keyboard(name)
-                await update.message.reply_text(caption, reply_markup=kb)
+    # Todas las URLs musicales se resuelven a la vez; las respuestas salen en
+    # el orden en que aparecen en el mensaje.
+    pending = {
+        url: asyncio.ensure_future(_safe_music_reply(url))
+        for url in urls
+        if not is_setlist_url(url) and is_music_url(url)
+    }
+    try:
+        for url in urls:
+            if is_setlist_url(url):
+                await handle_setlist(update, context, url)
                 continue
+            if url in pending:
+                await _send_music_reply(update, context, await pending[url])
+    finally:
+        for task in pending.values():
+            task.cancel()
 
-            links, title, artist_name, cover, page_url = await resolve_generic_music_url(url)
 
-            if not links:
-                await update.message.reply_text("No pude resolver ese enlace ahora. Intenta de nuevo en un momento.")
-                continue
+# -------- Inline mode --------
+# Trabajo inline en curso por usuario: cada consulta nueva cancela la anterior.
+INLINE_WORK: dict[int, asyncio.Task] = {}
+# Resultados inline ya armados, por URL normalizada (objetos de Telegram: solo memoria).
+INLINE_RESULT_CACHE = TTLCache("inline", CACHE_MAX_BYTES, 2000, persist=False)
 
-            lyrics_links = await get_lyrics_links(artist_name or "", title or "")
-            album_buttons = await derive_album_buttons_all(links)
-            key = remember_links(
-                links=links,
-                album_buttons=album_buttons,
-                lyrics_links=lyrics_links,
-                title=title,
-                artist_name=artist_name,
-                cover=cover,
-                page_url=page_url,
-            )
-            keyboard = build_keyboard(
-                links,
-                show_all=False,
-                key=key,
-                album_buttons=album_buttons,
-                lyrics_links=lyrics_links,
-            )
 
-            caption = "🎶 Disponible en:"
-            if title and artist_name:
-                caption = f"🎵 {title} — {artist_name}\n🎶 Disponible en:"
-            elif title:
-                caption = f"🎵 {title}\n🎶 Disponible en:"
+def _cached_inline_results(url: str) -> list | None:
+    cached = ttl_get(INLINE_RESULT_CACHE, normalize_music_url(url))
+    if not cached:
+        return None
+    # los botones "más/menos" apuntan a STORE; si esa entrada ya salió, re-renderizamos
+    if cached["store_key"] and cached["store_key"] not in STORE:
+        return None
+    return cached["results"]
+
 
-            if cover:
-                try:
-                    await context.bot.send_photo(
-                        chat_id=update.effective_chat.id,
-                        photo=cover,
-                        caption=caption,
-                        reply_markup=keyboard,
-                    )
-                    continue
-                except Exception as e:
-                    log.info(f"No pude usar la portada, envío texto. {e}")
+def _remember_inline_results(url: str, results: list, store_key: str | None):
+    ttl_set(
+        INLINE_RESULT_CACHE,
+        normalize_music_url(url),
+        {"results": results, "store_key": store_key},
+        INLINE_RESULT_TTL,
+    )
 
-            await update.message.reply_text(caption, reply_markup=keyboard)
 
+async def _answer_shared(update: Update, results: list):
+    # El resultado no depende de quién pregunta: Telegram puede reusarlo entre usuarios.
+    await update.inline_query.answer(results, cache_time=INLINE_SHARED_CACHE_TIME, is_personal=False)
 
-# -------- Inline mode --------
+
+async def _answer_resolved(update: Update, url: str, results: list, store_key: str | None, skipped: list):
+    # Solo un resultado completo se cachea y se comparte; si algo se saltó o llegó
+    # tarde, respuesta personal y corta para que la próxima consulta lo reintente.
+    if skipped:
+        log.info(f"Inline incompleto ({', '.join(skipped)}), sin cachear: {url}")
+        await update.inline_query.answer(results, cache_time=10, is_personal=True)
+        return
+    _remember_inline_results(url, results, store_key)
+    await _answer_shared(update, results)
+
+
+@with_budget(INLINE_BUDGET)
 async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.inline_query.from_user
+    uid = user.id if user else 0
+    prev = INLINE_WORK.pop(uid, None)
+    if prev is not None and not prev.done():
+        prev.cancel()
+
     q = (update.inline_query.query or "").strip()
     urls = find_urls(q)
     if not urls:
@@ -1781,6 +3502,31 @@ async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.inline_query.answer([], cache_time=10, is_personal=True)
         return
 
+    results = _cached_inline_results(url)
+    if results:
+        await _answer_shared(update, results)
+        return
+
+    # La resolución corre aparte para no bloquear el handler; así la próxima
+    # tecla del usuario puede cancelarla.
+    task = spawn(_debounced_inline_answer(update, context, url))
+    INLINE_WORK[uid] = task
+    task.add_done_callback(lambda t: INLINE_WORK.pop(uid, None) if INLINE_WORK.get(uid) is t else None)
+
+
+async def _debounced_inline_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
+    try:
+        # Telegram manda una consulta por tecla: esperamos a que la URL se estabilice.
+        await asyncio.sleep(INLINE_DEBOUNCE)
+        await _answer_inline_query(update, context, url)
+    except asyncio.CancelledError:
+        log.debug(f"Consulta inline reemplazada: {url}")
+        raise
+    except Exception as e:
+        log.warning(f"Fallo en consulta inline {url}: {e}")
+
+
+async def _answer_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
     artist = await detect_artist(url)
     if artist:
         name = artist["name"]
@@ -1796,17 +3542,23 @@ async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE
                 description="Buscar al artista en otras plataformas",
             )
         ]
-        await update.inline_query.answer(results, cache_time=10, is_personal=True)
+        _remember_inline_results(url, results, None)
+        await _answer_shared(update, results)
         return
 
-    links, title, artist_name, cover, page_url = await resolve_generic_music_url(url)
+    with track_skips() as skipped:
+        with track_skips() as resolve_skipped:
+            links, title, artist_name, cover, page_url = await resolve_generic_music_url(url)
 
-    if not links:
-        await update.inline_query.answer([], cache_time=5, is_personal=True)
-        return
+        if not links:
+            await update.inline_query.answer([], cache_time=5, is_personal=True)
+            return
+        index_single_track(url, links, title, artist_name, page_url, resolve_skipped)
 
-    lyrics_links = await get_lyrics_links(artist_name or "", title or "")
-    album_buttons = await derive_album_buttons_all(links)
+        lyrics_links, album_buttons = await asyncio.gather(
+            get_lyrics_links(artist_name or "", title or ""),
+            derive_album_buttons_all(links),
+        )
     key = remember_links(
         links=links,
         album_buttons=album_buttons,
@@ -1824,11 +3576,7 @@ async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE
         lyrics_links=lyrics_links,
     )
 
-    caption = "🎶 Disponible en:"
-    if title and artist_name:
-        caption = f"🎵 {title} — {artist_name}\n🎶 Disponible en:"
-    elif title:
-        caption = f"🎵 {title}\n🎶 Disponible en:"
+    caption = links_caption(title, artist_name)
 
     rid = str(uuid.uuid4())
     if cover:
@@ -1853,10 +3601,42 @@ async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
         ]
 
-    await update.inline_query.answer(results, cache_time=10, is_personal=True)
+    await _answer_resolved(update, url, results, key, skipped)
 
 
 # -------- Callbacks --------
+async def _edit_setlist_markup(context: ContextTypes.DEFAULT_TYPE, cq, key: str, page: int):
+    keyboard = build_setlist_keyboard(key, page=page)
+    try:
+        if cq.inline_message_id:
+            await context.bot.edit_message_reply_markup(
+                inline_message_id=cq.inline_message_id,
+                reply_markup=keyboard,
+            )
+        else:
+            await context.bot.edit_message_reply_markup(
+                chat_id=cq.message.chat_id,
+                message_id=cq.message.message_id,
+                reply_markup=keyboard,
+            )
+    except Exception as e:
+        log.warning(f"No pude editar teclado (setlist): {e}")
+
+
+async def _resolve_and_edit_setlist_page(context: ContextTypes.DEFAULT_TYPE, cq, key: str, page: int):
+    # fuera del handler: PTB procesa los updates en orden y no debe esperar SETLIST_BUDGET
+    try:
+        await ensure_setlist_page(key, page)
+    except Exception as e:
+        log.warning(f"setlist: fallo al resolver la página {page + 1}: {e}")
+    prefetch_setlist_page(key, page + 1)
+    entry = SETLIST_STORE.get(key)
+    if entry and entry.get("shown") != page:
+        # el usuario ya pasó a otra página; no pisar ese teclado
+        return
+    await _edit_setlist_markup(context, cq, key, page)
+
+
 async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cq = update.callback_query
     await cq.answer()
@@ -1872,21 +3652,18 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception:
             page = 0
 
-        keyboard = build_setlist_keyboard(key, page=page)
-        try:
-            if cq.inline_message_id:
-                await context.bot.edit_message_reply_markup(
-                    inline_message_id=cq.inline_message_id,
-                    reply_markup=keyboard,
-                )
-            else:
-                await context.bot.edit_message_reply_markup(
-                    chat_id=cq.message.chat_id,
-                    message_id=cq.message.message_id,
-                    reply_markup=keyboard,
-                )
-        except Exception as e:
-            log.warning(f"No pude editar teclado (setlist): {e}")
+        entry = SETLIST_STORE.get(key)
+        if entry:
+            page = _setlist_page_range(len(entry["items"]), page)[0]
+            entry["shown"] = page
+            task = entry["pages"].get(page)
+            if task is None or not task.done():
+                # la página aún no está resuelta: "⏳" ya, los botones llegan con la segunda edición
+                await _edit_setlist_markup(context, cq, key, page)
+                spawn(_resolve_and_edit_setlist_page(context, cq, key, page))
+                return
+            prefetch_setlist_page(key, page + 1)
+        await _edit_setlist_markup(context, cq, key, page)
         return
 
     if not (data.startswith("more|") or data.startswith("less|")):
@@ -1901,6 +3678,7 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     album_buttons = entry.get("albums", [])
     lyrics_links = entry.get("lyrics_links")
     show_all = data.startswith("more|")
+    entry["show_all"] = show_all
 
     keyboard = build_keyboard(
         links,
@@ -1938,10 +3716,19 @@ async def health_handler(request):
     return web.Response(text="ok")
 
 
+async def stats_handler(request):
+    return web.json_response({
+        "caches": cache_stats(),
+        "odesli": ODESLI_LIMITER.stats(),
+        "upstreams": {name: p.stats() for name, p in HOST_POLICIES.items()},
+    })
+
+
 async def start_health_server():
     app = web.Application()
     app.router.add_get("/", health_handler)
     app.router.add_get("/healthz", health_handler)
+    app.router.add_get("/stats", stats_handler)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
@@ -1956,12 +3743,36 @@ async def main():
     tg.add_handler(CallbackQueryHandler(callbacks))
 
     await start_health_server()
+    open_disk_cache()
+    await preload_disk_cache()
+    spawn(cache_sweeper())
+    if DISK_CACHE is not None:
+        spawn(disk_cache_flusher())
+    if HTTP_WARMUP:
+        spawn(warm_up_http_client())
     log.info("✅ Iniciando en modo POLLING…")
 
     await tg.initialize()
     await tg.start()
     await tg.updater.start_polling(drop_pending_updates=True)
-    await asyncio.Event().wait()
+
+    # Render detiene el contenedor con SIGTERM: salir ordenadamente para que
+    # el finally de __main__ vuelque la cache a disco.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await stop.wait()
+    log.info("Señal de parada recibida, cerrando…")
+    try:
+        await tg.updater.stop()
+        await tg.stop()
+        await tg.shutdown()
+    except Exception as e:
+        log.warning(f"Error al detener el bot: {e}")
 
 
 async def shutdown_http_client():
@@ -1982,3 +3793,4 @@ if __name__ == "__main__":
             asyncio.run(shutdown_http_client())
         except Exception:
             pass
+        close_disk_cache()